@@ -225,7 +225,7 @@ class ACO_World(GA_World):
         return Velocity((uniform(-limit/100, limit/100), uniform(-limit/100, limit/100)))
 
     def setup(self):
-        Agent.id = 0
+        Agent.next_id = 0
         self.gen_cities_and_links()
         average_link_length = self.total_dist(World.links) / len(World.links)
         self.best_tour_length = round( len(self.cities) * average_link_length )
@@ -233,7 +233,7 @@ class Minority_Game_World(World):
         self.done = False
 
     def setup(self):
-        Agent.id = 0
+        Agent.next_id = 0
         Minority_Game_World.steps_to_win = gui_get(STEPS_TO_WIN)
 
         # Adjust how far one step is based on number of steps needed to win
@@ -0,0 +1,159 @@
+"""
+A compressed-sparse-row (CSR) snapshot of a graph, for graph algorithms that would otherwise spend most of their
+time following Link objects from node to node. See Graph_World.adjacency().
+
+Adjacency(nodes, links) numbers the nodes 0 .. n-1 in the order given. node_index maps a node to its number and
+nodes maps a number back to its node. The neighbors of node i are indices[indptr[i]:indptr[i+1]], and for each
+position k in indices, links[link_ids[k]] is the link that connects node i to node indices[k]. ends[j] is the
+pair of node numbers of links[j]. Links are treated as undirected, i.e., each link appears once at each of its
+ends. A snapshot does not follow later changes to the graph. Make a new one.
+
+The algorithms take and return node numbers and link ids (indices into links). A search that records, for each
+node reached, the link by which it was reached (its parent link) returns those as an array, from which
+path_links() extracts the Links on the path to a node, e.g., to highlight them.
+"""
+
+from heapq import heappop, heappush
+from typing import List, Optional
+
+import numpy as np
+
+from core.pairs import expand
+
+
+class Adjacency:
+
+    def __init__(self, nodes, links):
+        self.nodes = list(nodes)
+        self.node_index = {node: i for (i, node) in enumerate(self.nodes)}
+        self.links = [lnk for lnk in links if lnk.agent_1 in self.node_index and lnk.agent_2 in self.node_index]
+        self.ends = np.array([(self.node_index[lnk.agent_1], self.node_index[lnk.agent_2]) for lnk in self.links],
+                             dtype=np.int64).reshape(-1, 2)
+        sources = np.concatenate([self.ends[:, 0], self.ends[:, 1]])
+        targets = np.concatenate([self.ends[:, 1], self.ends[:, 0]])
+        order = np.argsort(sources, kind='stable')
+        self.indices = targets[order]
+        self.link_ids = np.tile(np.arange(len(self.links)), 2)[order]
+        self.indptr = np.concatenate([[0], np.cumsum(np.bincount(sources, minlength=len(self.nodes)))])
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def bfs(self, source):
+        """
+        A breadth-first search from node number source. Returns the array of distances (numbers of links) from
+        source, -1 for unreachable nodes, and the array of parent link ids, -1 for source and unreachable nodes.
+        """
+        n = len(self.nodes)
+        distances = np.full(n, -1, dtype=np.int64)
+        parent_links = np.full(n, -1, dtype=np.int64)
+        distances[source] = 0
+        frontier = np.array([source], dtype=np.int64)
+        depth = 0
+        while len(frontier):
+            depth += 1
+            starts = self.indptr[frontier]
+            (_, positions) = expand(frontier, starts, self.indptr[frontier + 1] - starts)
+            positions = positions[distances[self.indices[positions]] == -1]
+            # A node may be reached by more than one link. np.unique keeps the first.
+            (frontier, first) = np.unique(self.indices[positions], return_index=True)
+            distances[frontier] = depth
+            parent_links[frontier] = self.link_ids[positions[first]]
+        return (distances, parent_links)
+
+    def bfs_distances(self, sources) -> np.ndarray:
+        """
+        The breadth-first-search distances (numbers of links) from each of the source nodes (given by number)
+        to every node, as an array of shape (len(sources), n). -1 means unreachable. The searches from all
+        the sources proceed together, one level at a time.
+        """
+        sources = np.asarray(sources, dtype=np.int64)
+        n = len(self.nodes)
+        distances = np.full((len(sources), n), -1, dtype=np.int64)
+        # distances.ravel()[row * n + node] is the distance from sources[row] to node.
+        flat_distances = distances.reshape(-1)
+        # Used to keep one copy of each (row, node) pair reached by more than one link.
+        first_copy = np.empty(distances.size, dtype=np.int64)
+        # The frontier is a set of (row, node) pairs: node was reached at the current depth from sources[row].
+        (rows, frontier) = (np.arange(len(sources)), sources)
+        distances[rows, frontier] = 0
+        depth = 0
+        while len(rows):
+            depth += 1
+            starts = self.indptr[frontier]
+            (rows, positions) = expand(rows, starts, self.indptr[frontier + 1] - starts)
+            reached = rows * n + self.indices[positions]
+            reached = reached[flat_distances[reached] == -1]
+            first_copy[reached] = np.arange(len(reached))
+            reached = reached[first_copy[reached] == np.arange(len(reached))]
+            flat_distances[reached] = depth
+            (rows, frontier) = (reached // n, reached % n)
+        return distances
+
+    def connected_components(self) -> np.ndarray:
+        """
+        The component number (0, 1, ...) of each node. Uses hooking and pointer jumping: each node points toward
+        the smallest node number known to be in its component until the pointers stop changing.
+        """
+        labels = np.arange(len(self.nodes))
+        (ends_1, ends_2) = (self.ends[:, 0], self.ends[:, 1])
+        while True:
+            (labels_1, labels_2) = (labels[ends_1], labels[ends_2])
+            if (labels_1 == labels_2).all():
+                break
+            # Hook: point the larger label (the root of its tree) at the smaller one.
+            np.minimum.at(labels, np.maximum(labels_1, labels_2), np.minimum(labels_1, labels_2))
+            # Jump: point every node directly at the root of its tree.
+            while True:
+                roots = labels[labels]
+                if (roots == labels).all():
+                    break
+                labels = roots
+        return np.unique(labels, return_inverse=True)[1].reshape(-1)
+
+    def degree_distribution(self) -> np.ndarray:
+        """ Element d is the number of nodes with d links. """
+        return np.bincount(self.degrees(), minlength=1)
+
+    def degrees(self) -> np.ndarray:
+        return np.diff(self.indptr)
+
+    def dijkstra(self, source, weights=None):
+        """
+        Dijkstra's shortest paths from node number source, with link ids as weights' indices. weights defaults
+        to the links' lengths. Returns the array of distances from source, inf for unreachable nodes, and the array
+        of parent link ids, as bfs() does.
+        """
+        weights = [lnk.length for lnk in self.links] if weights is None else list(weights)
+        (indptr, indices, link_ids) = (self.indptr.tolist(), self.indices.tolist(), self.link_ids.tolist())
+        distances = [float('inf')] * len(self.nodes)
+        parent_links = [-1] * len(self.nodes)
+        distances[source] = 0
+        queue = [(0, source)]
+        while queue:
+            (distance, node) = heappop(queue)
+            if distance > distances[node]:
+                continue
+            for k in range(indptr[node], indptr[node + 1]):
+                (nbr, link_id) = (indices[k], link_ids[k])
+                nbr_distance = distance + weights[link_id]
+                if nbr_distance < distances[nbr]:
+                    (distances[nbr], parent_links[nbr]) = (nbr_distance, link_id)
+                    heappush(queue, (nbr_distance, nbr))
+        return (np.array(distances), np.array(parent_links, dtype=np.int64))
+
+    def path_links(self, parent_links, source, target) -> Optional[List]:
+        """
+        The Links on the path from node number source to node number target found by the search from source
+        that produced parent_links, in order from source. None if target wasn't reached.
+        """
+        if target != source and parent_links[target] == -1:
+            return None
+        lnks = []
+        node = target
+        while node != source:
+            link_id = parent_links[node]
+            lnks.append(self.links[link_id])
+            (end_1, end_2) = self.ends[link_id]
+            node = end_1 if end_2 == node else end_2
+        return lnks[::-1]
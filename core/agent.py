@@ -1,5 +1,6 @@
 
-from math import sqrt
+from functools import lru_cache
+from math import hypot, sqrt
 from random import choice, randint
 from statistics import mean
 
@@ -9,12 +10,13 @@ from colour import COLOR_NAME_TO_RGB
 from pygame import Surface
 from pygame.color import Color
 from pygame.colordict import THECOLORS
+from pygame.rect import Rect
 
 import core.gui as gui
 import core.pairs as pairs
 import core.utils as utils
 from core.gui import HALF_PATCH_SIZE, PATCH_SIZE, SHAPES
-from core.pairs import Pixel_xy, RowCol, Velocity, XY, heading_and_speed_to_velocity
+from core.pairs import Pixel_xy, RowCol, Velocity, XY, heading_and_speed_to_velocity, wrap_around
 from core.sim_engine import gui_get
 from core.world_patch_block import Block, Patch, World
 
@@ -41,20 +43,58 @@ NETLOGO_PRIMARY_COLORS = [(color_name, Color(color_name))
 SQRT_2 = sqrt(2)
 
 
+@lru_cache(maxsize=8192)
+def agent_image(shape_name, rgba, scale, patch_size, heading) -> Surface:
+    """
+    The image of an agent of the given shape, color, and scale, rotated to heading. All agents that look alike
+    share it, so, e.g., a flock of identical birds needs only one image per heading. heading 0 is the unrotated
+    base image. The cache is bounded: the least recently used images are dropped when it is full.
+    """
+    if heading:
+        return pgt.rotate(agent_image(shape_name, rgba, scale, patch_size, 0), -heading)
+
+    # Give the agent a larger Surface (by sqrt(2)) to work with since it may rotate.
+    surface_size = XY((patch_size, patch_size))*SQRT_2
+    base_image = Surface(surface_size)
+
+    # This sets the rectangle to be transparent.
+    # Otherwise it would be black and would cover nearby agents.
+    # Even though it's a method of Surface, it can also take a Surface parameter.
+    # If the Surface parameter is not given, PyCharm complains.
+    # noinspection PyArgumentList
+    base_image = base_image.convert_alpha()
+    base_image.fill((0, 0, 0, 0))
+
+    factor = scale * PATCH_SIZE
+    if shape_name in SHAPES:
+        # Instead of using pygame's smoothscale to scale the image, scale the polygon instead.
+        scaled_shape = [(v[0]*factor,  v[1]*factor) for v in SHAPES[shape_name]]
+        pg.draw.polygon(base_image, rgba, scaled_shape, 0)
+    return base_image
+
+
 class Agent(Block):
 
+    __slots__ = ('animation_target', 'base_image', 'drawn_rect', 'heading', 'id', 'image', 'image_key', 'moves',
+                 'scale', 'shape_name', 'velocity')
+
     color_palette = choice([NETLOGO_PRIMARY_COLORS, PYGAME_COLORS])
 
     forces_cache = None
 
     half_patch_pixel = pairs.Pixel_xy((HALF_PATCH_SIZE(), HALF_PATCH_SIZE()))
 
-    id = 0
-
     key_step_done = True
 
+    # The id of the next agent to be created. (Each agent's own id is its id attribute.)
+    next_id = 0
+
     some_agent_changed = False
 
+    # The number of times any agent has moved. Each agent's own count is its moves attribute.
+    # Things computed from agent positions, e.g., Link.length, use these to tell when to recompute.
+    total_moves = 0
+
     def __init__(self, center_pixel=None, color=None, scale=1.4, shape_name='netlogo_figure'):
         # Can't make this a default value because pairs.CENTER_PIXEL()
         # isn't defined when the default values are compiled
@@ -68,16 +108,23 @@ class Agent(Block):
         super().__init__(center_pixel, color)
 
         self.scale = scale
+        self.moves = 0
 
         self.shape_name = shape_name
         self.base_image = self.create_base_image()
+        # The rotated base_image. Set when the agent is drawn.
+        self.image = None
 
-        self.id = Agent.id
-        Agent.id += 1
+        self.id = Agent.next_id
+        Agent.next_id += 1
 
         World.agents.add(self)
         self.current_patch().add_agent(self)
 
+        # Where this agent was last drawn, if anywhere. Used by World.draw_changes().
+        self.drawn_rect = None
+        World.agent_changed(self)
+
         self.animation_target = None
 
         # Agents are created with a random heading and a velocity of 0.
@@ -92,12 +139,18 @@ class Agent(Block):
         return f'{class_name}-{self.id}{tuple(self.center_pixel.round())}'
 
     def agents_in_radius(self, distance):
-        qualifying_agents = [agent for agent in World.agents
-                             if agent is not self and self.distance_to(agent) < distance]
+        """
+        The other agents closer than distance to this one. Only the agents on the patches
+        near this agent are examined. See World.patches_in_radius.
+        """
+        patches = World.patches_in_radius(self.center_pixel, distance, wrap_around())
+        # Check World.agents in case an agent was removed from it but not from its patch.
+        qualifying_agents = [agent for patch in patches for agent in patch.agents
+                             if agent is not self and agent in World.agents and self.distance_to(agent) < distance]
         return qualifying_agents
 
     def all_links(self):
-        return [lnk for lnk in World.links if self in (lnk.agent_1, lnk.agent_2)]
+        return list(World.link_set().links_of(self))
 
     def average_of_headings(self, agent_set, fn):
         """
@@ -128,30 +181,27 @@ class Agent(Block):
 
         return dxdy
 
-    def create_base_image(self):
-        base_image = self.create_blank_base_image()
+    def closest_agent(self, max_distance=None):
+        """
+        The other agent closest to this one (within max_distance if given) or None if there isn't one.
+        Search in a circle that doubles in radius until it contains an agent.
+        """
+        limit = max_distance if max_distance is not None else hypot(gui.SCREEN_PIXEL_WIDTH(),
+                                                                     gui.SCREEN_PIXEL_HEIGHT())
+        distance = min(limit, gui.BLOCK_SPACING())
+        while True:
+            nearby_agents = self.agents_in_radius(distance)
+            if nearby_agents:
+                return min(nearby_agents, key=lambda agent: self.distance_to(agent))
+            if distance >= limit:
+                return None
+            distance = min(limit, 2*distance)
 
-        factor = self.scale * PATCH_SIZE
-        if self.shape_name in SHAPES:
-            # Instead of using pygame's smoothscale to scale the image, scale the polygon instead.
-            scaled_shape = [(v[0]*factor,  v[1]*factor) for v in SHAPES[self.shape_name]]
-            pg.draw.polygon(base_image, self.color, scaled_shape, 0)
-        return base_image
-
-    def create_blank_base_image(self):
-
-        # Give the agent a larger Surface (by sqrt(2)) to work with since it may rotate.
-        surface_size = XY((self.rect.width, self.rect.height))*SQRT_2
-        blank_base_image = Surface(surface_size)
-
-        # This sets the rectangle to be transparent.
-        # Otherwise it would be black and would cover nearby agents.
-        # Even though it's a method of Surface, it can also take a Surface parameter.
-        # If the Surface parameter is not given, PyCharm complains.
-        # noinspection PyArgumentList
-        blank_base_image = blank_base_image.convert_alpha()
-        blank_base_image.fill((0, 0, 0, 0))
-        return blank_base_image
+    def create_base_image(self):
+        """ Look up (or create) this agent's unrotated image in the shared cache. See agent_image(). """
+        # noinspection PyAttributeOutsideInit
+        self.image_key = (self.shape_name, tuple(Color(self.color)), self.scale, gui.PATCH_SIZE)
+        return agent_image(*self.image_key, 0)
 
     def current_patch(self) -> Patch:
         row_col: RowCol = (self.center_pixel).pixel_to_row_col()
@@ -161,7 +211,10 @@ class Agent(Block):
     def delete(self):
         self.current_patch().remove_agent(self)
         World.agents.remove(self)
-        World.links -= {lnk for lnk in World.links if lnk.includes(self)}
+        if World.dirty_rects is not None and self.drawn_rect:
+            World.dirty_rects.append(self.drawn_rect)
+        links = World.link_set()
+        links.difference_update(links.links_of(self))
 
     def distance_to(self, other):
         dist = self.distance_to_pixel(other.center_pixel)
@@ -176,14 +229,25 @@ class Agent(Block):
     def draw(self, shape_name=None):
         # No point in rotating circles or nodes. Only rotate SHAPES.
         if self.shape_name in SHAPES:
-            self.image = pgt.rotate(self.base_image, -self.heading)
+            self.image = agent_image(*self.image_key, int(round(self.heading)) % 360)
             self.rect = self.image.get_rect(center=self.center_pixel)
         super().draw(shape_name=self.shape_name)
+        if World.dirty_agents is not None:
+            self.drawn_rect = self.footprint()
 
     def face_xy(self, xy: Pixel_xy):
         new_heading = (self.center_pixel).heading_toward(xy)
         self.set_heading(new_heading)
 
+    def footprint(self) -> Rect:
+        """ The screen area covered when this agent is drawn (not including its label). """
+        if self.shape_name in SHAPES:
+            return self.rect.copy()
+        radius = int(round(gui.BLOCK_SPACING()/2)*self.scale) if self.shape_name == 'circle' else 3
+        footprint = Rect((0, 0), (2*radius + 2, 2*radius + 2))
+        footprint.center = self.center_pixel.as_int()
+        return footprint
+
     def forward(self, speed=1):
         velocity = heading_and_speed_to_velocity(self.heading, speed)
         self.set_velocity(velocity)
@@ -199,13 +263,13 @@ class Agent(Block):
         return from_pixel.heading_toward(to_pixel)
 
     def in_links(self):
-        return [lnk for lnk in World.links if lnk.directed and lnk.agent_2 is self]
+        return [lnk for lnk in World.link_set().links_of(self) if lnk.directed and lnk.agent_2 is self]
 
     def lnk_nbrs(self):
         """
         Return a list of links from this node and the nodes to which they attach.
         """
-        lns = [(lnk, lnk.other_side(self)) for lnk in World.links if lnk.includes(self)]
+        lns = [(lnk, lnk.other_side(self)) for lnk in World.link_set().links_of(self)]
         return lns
 
     def move_by_dxdy(self, dxdy: Velocity):
@@ -249,7 +313,7 @@ class Agent(Block):
         new_patch.add_agent(self)
 
     def out_links(self):
-        return [lnk for lnk in World.links if lnk.directed and lnk.agent_1 is self]
+        return [lnk for lnk in World.link_set().links_of(self) if lnk.directed and lnk.agent_1 is self]
 
     @staticmethod
     def run_an_animation_step():
@@ -262,16 +326,21 @@ class Agent(Block):
 
     def set_center_pixel(self, xy: Pixel_xy):
         self.center_pixel: Pixel_xy = xy.wrap()
+        self.moves += 1
+        Agent.total_moves += 1
         # Set the center point of this agent's rectangle.
         self.rect.center = (self.center_pixel - Agent.half_patch_pixel).round()
+        World.agent_changed(self)
 
     def set_color(self, color):
         self.color = color
         self.base_image = self.create_base_image()
+        World.agent_changed(self)
 
     def set_heading(self, heading):
         # Keep heading as an int in range(360)
         self.heading = int(round(heading))
+        World.agent_changed(self)
 
     def set_target_by_dxdy(self, velocity):
         self.animation_target = self.center_pixel + velocity
@@ -337,19 +406,19 @@ class Turtle(Agent):
 
 
 # The Pylogo fuction that starts the simulation
-from core.sim_engine import SimEngine
+from core.sim_engine import HeadlessSimEngine, SimEngine
 
 
 def PyLogo(world_class=World, caption=None, gui_left_upper=None, gui_right_upper=None,
            agent_class=Agent, patch_class=Patch, auto_setup=True, patch_size=11, board_rows_cols=(51, 51),
-           clear=None, bounce=None, fps=None):
+           clear=None, bounce=None, fps=None, ticks_per_frame=None, profile=None):
     if gui_left_upper is None:
         gui_left_upper = []
     if caption is None:
         caption = utils.extract_class_name(world_class)
     sim_engine = SimEngine(gui_left_upper, caption=caption, gui_right_upper=gui_right_upper,
                            patch_size=patch_size, board_rows_cols=board_rows_cols,
-                           clear=clear, bounce=bounce, fps=fps)
+                           clear=clear, bounce=bounce, fps=fps, ticks_per_frame=ticks_per_frame, profile=profile)
     gui.WINDOW.read(timeout=10)
 
     the_world = world_class(patch_class, agent_class)
@@ -357,3 +426,20 @@ def PyLogo(world_class=World, caption=None, gui_left_upper=None, gui_right_upper
     gui.WINDOW.read(timeout=10)
 
     sim_engine.top_loop(the_world, auto_setup=auto_setup)
+
+
+def PyLogo_headless(world_class=World, gui_left_upper=None, gui_right_upper=None, parameters=None,
+                    agent_class=Agent, patch_class=Patch, patch_size=11, board_rows_cols=(51, 51),
+                    clear=None, bounce=None, fps=None, max_ticks=None, profile=None):
+    """
+    Like PyLogo, but run the model without a window: no PySimpleGUI, no drawing, no frame-rate limit.
+    parameters is a dictionary {widget key: value} that overrides the defaults in the gui layouts.
+    Returns the World after it is done or has run for max_ticks ticks.
+    """
+    sim_engine = HeadlessSimEngine(gui_left_upper, gui_right_upper=gui_right_upper, parameters=parameters,
+                                   patch_size=patch_size, board_rows_cols=board_rows_cols,
+                                   clear=clear, bounce=bounce, fps=fps, profile=profile)
+
+    the_world = world_class(patch_class, agent_class)
+
+    return sim_engine.run(the_world, max_ticks=max_ticks)
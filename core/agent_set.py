@@ -0,0 +1,239 @@
+"""
+An optional array-backed store for agents.
+
+Ordinarily each Agent keeps its own position, heading, and velocity, and moving all the agents is a Python loop.
+An ArrayAgent instead keeps its state in a row of the World's AgentSet, whose columns (x, y, heading, dx, dy,
+color_index, moves) are NumPy arrays, (dx, dy) being the velocity. Each ArrayAgent is a view of its row:
+center_pixel, heading, velocity, and color read and write the columns. So all the usual Agent methods still work
+on individual agents, while the AgentSet operations (forward, turn_right, face_xy, move_by_velocity, ...) act on
+all the agents, or on selected rows, at once, including wrapping around or bouncing off the screen edges and
+keeping the patches' agent sets current.
+
+To use it, derive the model's agent class from ArrayAgent rather than Agent. World.agent_set is then the
+AgentSet. E.g., to move every agent forward one step:
+
+    World.agent_set.forward(1)
+
+rows, in the operations below, selects the agents to act on. It is anything that indexes a NumPy array:
+an array of row numbers, a boolean mask over the rows, or a slice. None means all the agents.
+"""
+
+import numpy as np
+from pygame.color import Color
+
+import core.gui as gui
+from core.agent import Agent
+from core.pairs import Pixel_xy, Velocity
+from core.sim_engine import gui_get
+from core.world_patch_block import World
+
+
+class AgentSet:
+
+    COLUMNS = ['x', 'y', 'heading', 'dx', 'dy', 'color_index', 'moves']
+
+    def __init__(self, capacity=1024):
+        self.count = 0
+        # agents[i] is the ArrayAgent whose state is in row i.
+        self.agents = []
+        # The colors referred to by the color_index column, and the index of each color by its rgba.
+        self.palette = []
+        self.palette_indices = {}
+        self.x = np.zeros(capacity)
+        self.y = np.zeros(capacity)
+        self.heading = np.zeros(capacity)
+        # The velocities. As for an Agent, these are separate from the headings.
+        self.dx = np.zeros(capacity)
+        self.dy = np.zeros(capacity)
+        self.color_index = np.zeros(capacity, dtype=np.int32)
+        # The number of times each agent has moved. See Agent.moves.
+        self.moves = np.zeros(capacity, dtype=np.int64)
+
+    def __len__(self):
+        return self.count
+
+    def add(self, agent) -> int:
+        """ Give agent a row. Return the row number. """
+        if self.count == len(self.x):
+            for column in AgentSet.COLUMNS:
+                array = getattr(self, column)
+                setattr(self, column, np.concatenate([array, np.zeros_like(array)]))
+        row = self.count
+        self.agents.append(agent)
+        self.count += 1
+        return row
+
+    def changed(self, rows):
+        """ If the World is tracking changes, note that the agents in rows must be redrawn. """
+        if World.dirty_agents is not None:
+            World.dirty_agents.update(self.agents[row] for row in np.arange(self.count)[rows].tolist())
+
+    def color_to_index(self, color) -> int:
+        """ The index in the palette of color. Add it to the palette if it's not already there. """
+        rgba = tuple(Color(color))
+        if rgba not in self.palette_indices:
+            self.palette_indices[rgba] = len(self.palette)
+            self.palette.append(color)
+        return self.palette_indices[rgba]
+
+    def face_dxdy(self, dx, dy, rows=None):
+        """ Turn the agents in rows to face the (dx, dy) directions. Round the headings as Agent.set_heading does. """
+        rows = self.rows(rows)
+        # (-1) to compensate for the inverted y-axis. An agent facing its own pixel keeps its heading.
+        headings = 90 - np.degrees(np.arctan2(-dy, dx))
+        self.heading[rows] = np.where((dx == 0) & (dy == 0), self.heading[rows], np.rint(headings) % 360)
+        self.changed(rows)
+
+    def face_xy(self, xy, rows=None):
+        """ Turn the agents in rows to face pixel xy, or, if xy is an (n, 2) array, each to face its own pixel. """
+        rows = self.rows(rows)
+        xy = np.asarray(xy, dtype=float)
+        self.face_dxdy(xy[..., 0] - self.x[rows], xy[..., 1] - self.y[rows], rows)
+
+    def forward(self, speed=1, rows=None):
+        """
+        Like Agent.forward: set the velocities of the agents in rows to speed in their heading directions,
+        face those velocities, and move by them.
+        """
+        rows = self.rows(rows)
+        radians = np.radians(self.heading[rows])
+        (dx, dy) = (speed * np.sin(radians), -speed * np.cos(radians))
+        (self.dx[rows], self.dy[rows]) = (dx, dy)
+        self.face_dxdy(dx, dy, rows)
+        self.move_by_velocity(rows)
+
+    def move_by_velocity(self, rows=None):
+        """
+        Move the agents in rows by their velocities. As in Agent.move_by_velocity, if Bounce? is on, agents that
+        would leave the screen bounce off its edges: their velocities are flipped and they face the new velocities.
+        Otherwise they wrap around.
+        """
+        rows = self.rows(rows)
+        spacing = gui.BLOCK_SPACING()
+        (dx, dy) = self.velocity_dxdy(rows)
+        (x, y) = (self.x[rows], self.y[rows])
+        if gui_get('Bounce?'):
+            bounce_x = ((x + dx) // spacing < 0) | ((x + dx) // spacing >= gui.PATCH_COLS)
+            bounce_y = ((y + dy) // spacing < 0) | ((y + dy) // spacing >= gui.PATCH_ROWS)
+            (dx, dy) = (np.where(bounce_x, -dx, dx), np.where(bounce_y, -dy, dy))
+            (self.dx[rows], self.dy[rows]) = (dx, dy)
+            bounced = bounce_x | bounce_y
+            self.face_dxdy(dx[bounced], dy[bounced], np.arange(self.count)[rows][bounced])
+        old_patches = self.patch_indices(rows)
+        # Wrap as Pixel_xy.wrap() does.
+        self.x[rows] = (x + dx) % (gui.SCREEN_PIXEL_WIDTH() - 1)
+        self.y[rows] = (y + dy) % (gui.SCREEN_PIXEL_HEIGHT() - 1)
+        self.moves[rows] += 1
+        Agent.total_moves += 1
+        self.update_patches(rows, old_patches)
+        self.changed(rows)
+
+    def patch_indices(self, rows):
+        """ The indices in World.patches of the patches the agents in rows are on. """
+        spacing = gui.BLOCK_SPACING()
+        patch_rows = (self.y[rows] // spacing).astype(int)
+        patch_cols = (self.x[rows] // spacing).astype(int)
+        return patch_rows * gui.PATCH_COLS + patch_cols
+
+    def remove(self, agent):
+        """ Remove agent's row. The last row is moved into its place. """
+        (row, last) = (agent.row, self.count - 1)
+        if row != last:
+            for column in AgentSet.COLUMNS:
+                array = getattr(self, column)
+                array[row] = array[last]
+            moved_agent = self.agents[last]
+            moved_agent.row = row
+            self.agents[row] = moved_agent
+        self.agents.pop()
+        self.count -= 1
+
+    def rows(self, rows):
+        """ rows as something that indexes the columns, whose lengths are the capacity rather than the count. """
+        return slice(0, self.count) if rows is None else np.arange(self.count)[rows]
+
+    def turn_left(self, angles, rows=None):
+        self.turn_right(-np.asarray(angles), rows)
+
+    def turn_right(self, angles, rows=None):
+        """ Turn the agents in rows by angles: a number or an array with one angle for each of those agents. """
+        rows = self.rows(rows)
+        self.heading[rows] = np.rint(self.heading[rows] + angles) % 360
+        self.changed(rows)
+
+    def update_patches(self, rows, old_patches):
+        """ Move the agents in rows that have changed patches from their old patches' agent sets to their new ones. """
+        new_patches = self.patch_indices(rows)
+        moved = np.nonzero(old_patches != new_patches)[0]
+        agent_rows = np.arange(self.count)[rows]
+        for i in moved.tolist():
+            agent = self.agents[agent_rows[i]]
+            World.patches[old_patches[i]].agents.discard(agent)
+            World.patches[new_patches[i]].add_agent(agent)
+
+    def velocity_dxdy(self, rows=None):
+        """ The (dx, dy) velocities of the agents in rows. """
+        rows = self.rows(rows)
+        return (self.dx[rows].copy(), self.dy[rows].copy())
+
+
+class ArrayAgent(Agent):
+    """ An Agent whose position, heading, velocity, and color are kept in World.agent_set. """
+
+    __slots__ = ('row',)
+
+    def __init__(self, *args, **kwargs):
+        if World.agent_set is None:
+            World.agent_set = AgentSet()
+        self.row = World.agent_set.add(self)
+        super().__init__(*args, **kwargs)
+
+    @property
+    def center_pixel(self) -> Pixel_xy:
+        agent_set = World.agent_set
+        return Pixel_xy((agent_set.x[self.row], agent_set.y[self.row]))
+
+    @center_pixel.setter
+    def center_pixel(self, xy):
+        (World.agent_set.x[self.row], World.agent_set.y[self.row]) = xy
+
+    @property
+    def color(self):
+        return World.agent_set.palette[World.agent_set.color_index[self.row]]
+
+    @color.setter
+    def color(self, color):
+        World.agent_set.color_index[self.row] = World.agent_set.color_to_index(color)
+
+    def delete(self):
+        super().delete()
+        World.agent_set.remove(self)
+
+    def draw(self, shape_name=None):
+        # The AgentSet operations move agents without updating their rects.
+        self.rect.center = self.center_pixel
+        super().draw(shape_name=shape_name)
+
+    @property
+    def heading(self):
+        return int(World.agent_set.heading[self.row])
+
+    @heading.setter
+    def heading(self, heading):
+        World.agent_set.heading[self.row] = heading
+
+    @property
+    def moves(self):
+        return int(World.agent_set.moves[self.row])
+
+    @moves.setter
+    def moves(self, moves):
+        World.agent_set.moves[self.row] = moves
+
+    @property
+    def velocity(self) -> Velocity:
+        return Velocity((World.agent_set.dx[self.row], World.agent_set.dy[self.row]))
+
+    @velocity.setter
+    def velocity(self, velocity):
+        (World.agent_set.dx[self.row], World.agent_set.dy[self.row]) = velocity
@@ -0,0 +1,99 @@
+"""
+A parameter-sweep runner, like NetLogo's BehaviorSpace.
+
+run_experiment() runs a model headless (see core.agent.PyLogo_headless) once for every combination
+of the values in a parameter grid and every replicate, spreading the runs across a pool of processes.
+The grid is keyed by the same widget keys gui_get uses. Each run produces one row (a dictionary) of
+the results table: its parameter values, replicate number, seed, ticks, and the value of each reporter.
+
+Since the runs execute in other processes, the world_class and the reporters must be picklable.
+A reporter is either the name of a World attribute (a str) or a module-level function of the World.
+See models/segregation_experiment.py for an example.
+"""
+
+import csv
+from itertools import product
+from multiprocessing import Pool
+from random import seed as random_seed
+
+import numpy as np
+import pygame as pg
+
+from core.agent import Agent, PyLogo_headless
+from core.world_patch_block import LinkSet, Patch, World
+
+
+def parameter_combinations(parameter_grid):
+    """
+    Return a list of dictionaries, one for each combination of the values in parameter_grid.
+    A grid entry that is not a list, tuple, or range is treated as a single value.
+    """
+    keys = list(parameter_grid)
+    value_lists = [values if isinstance(values, (list, tuple, range)) else [values]
+                   for values in parameter_grid.values()]
+    return [dict(zip(keys, combination)) for combination in product(*value_lists)]
+
+
+def report(world, reporter):
+    return getattr(world, reporter) if isinstance(reporter, str) else reporter(world)
+
+
+def run_experiment(world_class=World, parameter_grid=None, reporters=None, replicates=1,
+                   gui_left_upper=None, gui_right_upper=None, agent_class=Agent, patch_class=Patch,
+                   max_ticks=None, processes=None, base_seed=0, **kwargs):
+    """
+    Run world_class replicates times for each combination of values in parameter_grid.
+
+    reporters is a dictionary {column name: reporter}. Each reporter is applied to the World when its run ends.
+    processes is the size of the process pool. None means one per core.
+    Run number i is seeded with base_seed + i, so an experiment can be repeated exactly. Each run gets a fresh
+    process, so no class-level state (e.g., Agent.next_id) carries over from one run to the next.
+    kwargs (patch_size, board_rows_cols, bounce, etc.) are passed along to PyLogo_headless.
+
+    Returns the results table as a list of rows (dictionaries) in run order.
+    """
+    runs = [{'run': run_nbr, 'replicate': replicate, 'seed': base_seed + run_nbr, 'parameters': parameters}
+            for (run_nbr, (parameters, replicate)) in
+            enumerate(product(parameter_combinations(parameter_grid or {}), range(replicates)))]
+    settings = {'world_class': world_class, 'reporters': reporters or {}, 'gui_left_upper': gui_left_upper,
+                'gui_right_upper': gui_right_upper, 'agent_class': agent_class, 'patch_class': patch_class,
+                'max_ticks': max_ticks, 'kwargs': kwargs}
+    pool = Pool(processes, maxtasksperchild=1)
+    try:
+        rows = pool.map(run_one, [(settings, run) for run in runs], chunksize=1)
+    finally:
+        # Let the workers exit on their own. terminate() doesn't stop workers in which pygame was initialized.
+        pool.close()
+        pool.join()
+    return rows
+
+
+def run_one(settings_and_run):
+    """ Execute a single run in a pool process and return its row of the results table. """
+    (settings, run) = settings_and_run
+    # Start from the same class-level state as a new process would.
+    Agent.next_id = 0
+    Agent.total_moves = 0
+    LinkSet.changes = 0
+    random_seed(run['seed'])
+    np.random.seed(run['seed'] % 2**32)
+    world = PyLogo_headless(settings['world_class'], gui_left_upper=settings['gui_left_upper'],
+                            gui_right_upper=settings['gui_right_upper'], parameters=run['parameters'],
+                            agent_class=settings['agent_class'], patch_class=settings['patch_class'],
+                            max_ticks=settings['max_ticks'], **settings['kwargs'])
+    row = {'run': run['run'], **run['parameters'], 'replicate': run['replicate'], 'seed': run['seed'],
+           'ticks': world.ticks}
+    for (name, reporter) in settings['reporters'].items():
+        row[name] = report(world, reporter)
+    pg.quit()
+    return row
+
+
+def write_csv(rows, file_name):
+    """ Write the results table produced by run_experiment to a csv file. """
+    if not rows:
+        return
+    with open(file_name, 'w', newline='') as csv_file:
+        writer = csv.DictWriter(csv_file, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
@@ -1,19 +1,24 @@
 
+from collections import deque
 from math import sqrt
 from random import choice, sample
 from typing import List, Optional, Tuple
 
+import numpy as np
 from pygame.color import Color
 from pygame.draw import circle
 
 import core.gui as gui
+from core.adjacency import Adjacency
 from core.agent import Agent, PYGAME_COLORS
 from core.gui import (BLOCK_SPACING, CIRCLE, HOR_SEP, KNOWN_FIGURES, NETLOGO_FIGURE, SCREEN_PIXEL_HEIGHT,
                       SCREEN_PIXEL_WIDTH, STAR)
 from core.link import Link, link_exists
-from core.pairs import ATT_COEFF, ATT_EXPONENT, Pixel_xy, REP_COEFF, REP_EXPONENT, Velocity, force_as_dxdy
+from core.pairs import (ATT_COEFF, ATT_EXPONENT, BARNES_HUT_THETA, Pixel_xy, REP_COEFF, REP_EXPONENT, Velocity,
+                        attraction, displacements, distances, force_as_dxdy, headings_to_unit_dxdys, headings_toward,
+                        repulsion, repulsive_forces, sum_by_index)
 from core.sim_engine import gui_get, gui_set
-from core.world_patch_block import World
+from core.world_patch_block import LinkSet, World
 
 
 class Graph_Node(Agent):
@@ -59,7 +64,8 @@ class Graph_Node(Agent):
             repulsive_wall_force += force_as_dxdy(y_pixel, v_wall_pixel, screen_distance_unit)
 
         attractive_force: Velocity = Velocity((0, 0))
-        for node in (World.agents - {self}):
+        # Only the nodes this one is linked to attract it.
+        for node in {nbr for (_lnk, nbr) in self.lnk_nbrs()}:
             if link_exists(self, node):
                 attractive_force += force_as_dxdy(self.center_pixel, node.center_pixel, screen_distance_unit,
                                                        repulsive=False)
@@ -79,10 +85,6 @@ class Graph_Node(Agent):
                   )
         return normalized_force
 
-    def delete(self):
-        World.agents.remove(self)
-        World.links -= {lnk for lnk in World.links if lnk.includes(self)}
-
     def draw(self, shape_name=None):
         super().draw(shape_name=shape_name)
         if self.selected:
@@ -90,17 +92,122 @@ class Graph_Node(Agent):
             circle(gui.SCREEN, Color('red'), self.rect.center, radius, 1)
 
 
+class Graph_Clustering:
+    """
+    The neighbors of each node and the number of links among them (i.e., the number of triangles the node is in),
+    from which the clustering coefficient is computed. A Graph_Clustering watches a LinkSet (see LinkSet.watchers),
+    so adding or removing a link updates the counts in time proportional to the degrees of the link's nodes.
+    Links are treated as undirected. Two links between the same pair of nodes count once.
+    """
+
+    def __init__(self, links: LinkSet):
+        self.links = links
+        self.neighbors = {}
+        self.triangles = {}
+        # The number of links between each pair of nodes.
+        self.link_counts = {}
+        for lnk in links:
+            self.link_added(lnk)
+        links.watchers.append(self)
+
+    def clustering_coefficient(self) -> Optional[float]:
+        """
+        The average over the nodes with at least two neighbors of the fraction of the pairs of their neighbors that
+        are linked. (As in NetLogo, the coefficient is undefined for the other nodes.) None if there are no such nodes.
+        """
+        coefficients = [self.triangles[node] / (len(nbrs) * (len(nbrs) - 1) / 2)
+                        for (node, nbrs) in self.neighbors.items() if len(nbrs) > 1]
+        return sum(coefficients) / len(coefficients) if coefficients else None
+
+    def link_added(self, lnk):
+        (node_a, node_b) = (lnk.agent_1, lnk.agent_2)
+        pair = frozenset({node_a, node_b})
+        self.link_counts[pair] = self.link_counts.get(pair, 0) + 1
+        if node_a is node_b or self.link_counts[pair] > 1:
+            return
+        (nbrs_a, nbrs_b) = (self.neighbors.setdefault(node_a, set()), self.neighbors.setdefault(node_b, set()))
+        # The new link completes a triangle with each common neighbor.
+        common = nbrs_a & nbrs_b
+        for node in common:
+            self.triangles[node] += 1
+        for (node, nbrs, nbr) in [(node_a, nbrs_a, node_b), (node_b, nbrs_b, node_a)]:
+            self.triangles[node] = self.triangles.get(node, 0) + len(common)
+            nbrs.add(nbr)
+
+    def link_removed(self, lnk):
+        (node_a, node_b) = (lnk.agent_1, lnk.agent_2)
+        pair = frozenset({node_a, node_b})
+        self.link_counts[pair] -= 1
+        if self.link_counts[pair]:
+            return
+        del self.link_counts[pair]
+        if node_a is node_b:
+            return
+        (nbrs_a, nbrs_b) = (self.neighbors[node_a], self.neighbors[node_b])
+        nbrs_a.discard(node_b)
+        nbrs_b.discard(node_a)
+        common = nbrs_a & nbrs_b
+        for node in common:
+            self.triangles[node] -= 1
+        for (node, nbrs) in [(node_a, nbrs_a), (node_b, nbrs_b)]:
+            self.triangles[node] -= len(common)
+            if not nbrs:
+                del self.neighbors[node]
+                del self.triangles[node]
+
+
 class Graph_World(World):
 
     def __init__(self, patch_class, agent_class):
         self.velocity_adjustment = 1
+        # The Barnes-Hut accuracy parameter for the force-directed layout. See pairs.repulsive_forces().
+        self.theta = BARNES_HUT_THETA
+        # The average path length of a graph with more nodes than this is estimated from the paths
+        # starting at this many randomly chosen nodes.
+        self.path_length_sources = 250
         super().__init__(patch_class, agent_class)
         self.shortest_path_links = None
         self.selected_nodes = set()
+        # The selected nodes and LinkSet.changes when the shortest path was last built. See build_shortest_path().
+        self.shortest_path_key = None
+        # The metrics are recomputed only when the links change. These are (LinkSet.changes, value) pairs.
+        self.path_length_cache = (None, None)
+        self.clustering_cache = (None, None)
+        self.clustering = None
 
-    # noinspection PyMethodMayBeStatic
-    def average_path_length(self):
-        return TBD
+    @staticmethod
+    def adjacency() -> Adjacency:
+        """
+        A CSR snapshot of the current nodes and links, on which the graph algorithms in core.adjacency run.
+        E.g., to highlight a shortest path by link length between nodes node_a and node_b:
+
+            adjacency = self.adjacency()
+            (source, target) = (adjacency.node_index[node_a], adjacency.node_index[node_b])
+            (_distances, parent_links) = adjacency.dijkstra(source)
+            for lnk in adjacency.path_links(parent_links, source, target) or []:
+                lnk.color = Color('red')
+        """
+        # Number the nodes in the order they were created, not in the set's (address-dependent) order,
+        # so that the numbering, and anything sampled from it, is the same from run to run.
+        return Adjacency(sorted(World.agents, key=lambda node: node.id), World.links)
+
+    def average_path_length(self) -> Optional[float]:
+        """
+        The average number of links on the shortest paths between pairs of (distinct) connected nodes, or None
+        if there are no such pairs. Computed by breadth-first searches on a CSR snapshot of the graph.
+        See core.adjacency.
+        """
+        (changes, avg_path_length) = self.path_length_cache
+        if changes != LinkSet.changes:
+            adjacency = self.adjacency()
+            sources = range(len(adjacency))
+            if len(adjacency) > self.path_length_sources:
+                sources = sample(sources, self.path_length_sources)
+            distances = adjacency.bfs_distances(list(sources))
+            path_lengths = distances[distances > 0]
+            avg_path_length = round(float(path_lengths.mean()), 3) if len(path_lengths) else None
+            self.path_length_cache = (LinkSet.changes, avg_path_length)
+        return avg_path_length
 
     def build_graph(self):
         """
@@ -126,8 +233,16 @@ class Graph_World(World):
             self.link_nodes_for_graph(graph_type, nbr_nodes, ring_node_list)
 
     def build_shortest_path(self):
-        Graph_World.reset_links()
+        """
+        Highlight the shortest path, if any, between the two selected nodes. Nothing is done unless
+        the selection or the links have changed since the last time.
+        """
         self.selected_nodes = [node for node in World.agents if node.selected]
+        shortest_path_key = (frozenset(self.selected_nodes), LinkSet.changes)
+        if shortest_path_key == self.shortest_path_key:
+            return
+        self.shortest_path_key = shortest_path_key
+        Graph_World.reset_links()
         # If there are exactly two selected nodes, find the shortest path between them.
         if len(self.selected_nodes) == 2:
             self.shortest_path_links = self.shortest_path()
@@ -140,13 +255,21 @@ class Graph_World(World):
 
     def compute_metrics(self):
         clust_coefficient = self.clustering_coefficient()
-        gui_set(CLUSTER_COEFF, value=clust_coefficient)
+        # An undefined metric (None) is shown as a blank.
+        gui_set(CLUSTER_COEFF, value='' if clust_coefficient is None else str(clust_coefficient))
         avg_path_length = self.average_path_length()
-        gui_set(PATH_LENGTH, value=avg_path_length)
-
-    # noinspection PyMethodMayBeStatic
-    def clustering_coefficient(self):
-        return TBD
+        gui_set(PATH_LENGTH, value='' if avg_path_length is None else str(avg_path_length))
+
+    def clustering_coefficient(self) -> Optional[float]:
+        """ See Graph_Clustering. Its counts are kept current as links are added and removed. """
+        (changes, clust_coefficient) = self.clustering_cache
+        if changes != LinkSet.changes:
+            if self.clustering is None or self.clustering.links is not World.link_set():
+                self.clustering = Graph_Clustering(World.link_set())
+            clust_coefficient = self.clustering.clustering_coefficient()
+            clust_coefficient = None if clust_coefficient is None else round(clust_coefficient, 3)
+            self.clustering_cache = (LinkSet.changes, clust_coefficient)
+        return clust_coefficient
 
     @staticmethod
     def create_random_link():
@@ -214,6 +337,65 @@ class Graph_World(World):
         self.disable_enable_buttons()
         super().draw()
 
+    def force_directed_step(self, screen_distance_unit):
+        """
+        Move every node as Graph_Node.adjust_distances() does, but for all the nodes at once. The repulsive,
+        wall, and attractive forces are computed with NumPy from an array of the node positions and an array
+        of the (undirected) links as pairs of node indices. The gui values are read once. All the forces are
+        computed from the positions at the start of the step. The nodes are then moved one step each.
+        """
+        # In the order the nodes were created, so that a step doesn't depend on the set's order.
+        nodes = sorted(World.agents, key=lambda node: node.id)
+        if not nodes:
+            return
+        index = {node: i for (i, node) in enumerate(nodes)}
+        xys = np.array([node.center_pixel for node in nodes], dtype=float)
+        links = np.array([(index[lnk.agent_1], index[lnk.agent_2]) for lnk in World.links
+                          if not lnk.directed and lnk.agent_1 is not lnk.agent_2
+                          and lnk.agent_1 in index and lnk.agent_2 in index], dtype=int).reshape(-1, 2)
+        (rep_coefficient, rep_exponent) = (gui_get(REP_COEFF, 1), gui_get(REP_EXPONENT, 2))
+        (att_coefficient, att_exponent) = (gui_get(ATT_COEFF, 1), gui_get(ATT_EXPONENT, 2))
+
+        repulsive_force = repulsive_forces(xys, screen_distance_unit, theta=self.theta,
+                                           rep_coefficient=rep_coefficient, rep_exponent=rep_exponent)
+
+        # The walls push on each node's x (and y) coordinate from both sides. As in force_as_dxdy, a wall
+        # pushes directly away from itself even if the world wraps. Only the distance can go around the edge.
+        zeros = np.zeros(len(nodes))
+        (x_pixels, y_pixels) = (np.column_stack([xys[:, 0], zeros]), np.column_stack([zeros, xys[:, 1]]))
+        walls = [(x_pixels, (0, 0)), (x_pixels, (SCREEN_PIXEL_WIDTH(), 0)),
+                 (y_pixels, (0, 0)), (y_pixels, (0, SCREEN_PIXEL_HEIGHT()))]
+        repulsive_wall_force = sum(repulsion(pixels - wall, screen_distance_unit, rep_coefficient, rep_exponent,
+                                             dists=distances(wall, pixels)) for (pixels, wall) in walls)
+
+        # Each link pulls on the nodes at both of its ends.
+        (ends, other_ends) = (links.T.ravel(), links[:, ::-1].T.ravel())
+        attractive_force = sum_by_index(ends, attraction(displacements(xys[ends], xys[other_ends]),
+                                                         screen_distance_unit, att_coefficient, att_exponent),
+                                        len(nodes))
+
+        net_force = repulsive_force + repulsive_wall_force + attractive_force
+        largest = np.maximum(np.maximum(net_force[:, 0], net_force[:, 1]), self.velocity_adjustment)
+        normalized_force = net_force / largest[:, np.newaxis] * 10
+
+        if gui_get(PRINT_FORCE_VALUES):
+            for (i, node) in enumerate(nodes):
+                print(f'{node}. \n'
+                      f'rep-force {tuple(repulsive_force[i].round(2))}; \n'
+                      f'rep-wall-force {tuple(repulsive_wall_force[i].round(2))}; \n'
+                      f'att-force {tuple(attractive_force[i].round(2))}; \n'
+                      f'net-force {tuple(net_force[i].round(2))}; \n'
+                      f'normalized_force {tuple(normalized_force[i].round(2))}; \n\n'
+                      )
+
+        # As in adjust_distances: face the force and go forward 1.
+        headings = headings_toward(normalized_force)
+        velocities = headings_to_unit_dxdys(headings)
+        for (node, heading, velocity) in zip(nodes, headings.tolist(), velocities.tolist()):
+            node.set_heading(heading)
+            node.velocity = Velocity(velocity)
+            node.move_by_velocity()
+
     def handle_event(self, event):
         """
         This is called when a GUI widget is changed and the change isn't handled by the system.
@@ -293,48 +475,35 @@ class Graph_World(World):
         Uses a breadth-first search.
         """
         (node1, node2) = self.selected_nodes
+        # The links of each node, from the World.links index.
+        agent_links = World.link_set().agent_links
         # Start with the node with the smaller number of neighbors.
-        if len(node1.lnk_nbrs()) > len(node2.lnk_nbrs()):
+        if len(agent_links.get(node1, ())) > len(agent_links.get(node2, ())):
             (node1, node2) = (node2, node1)
-        visited = {node1}
 
-        # A path is a sequence of tuples (link, node) where
-        # the link attaches to the node in the preceding
-        # tuple. The first tuple in a path starts with a
-        # None link since there is no preceding node.
+        # Rather than keeping whole paths in the frontier, record for each node reached
+        # the link by which it was first reached. node1 was reached by no link.
+        parent_links = {node1: None}
 
-        # The frontier is a list of paths, shortest first.
-        frontier = [[(None, node1)]]
+        # The frontier is a queue of reached nodes, nearest first.
+        frontier = deque([node1])
         while frontier:
-            current_path = frontier.pop(0)
-            # The lnk_nbrs are tuples as in the paths. For a given node
-            # they are all the node's links along with the nodes linked to.
-
-            # This gets the last node in the current path,
-            (_last_link, last_node) = current_path[-1]
-
-            # This gets all the non-visited lnk_nbrs of the last node.
-            # Each neighbor is a (link, node) pair. 
-            lnk_nbrs = [(lnk, nbr) for (lnk, nbr) in last_node.lnk_nbrs() if nbr not in visited]
-
-            # Do any of these continuations reach the target, node_2? If so, we've found the shortest path.
-            lnks_to_node_2 = [(lnk, nbr) for (lnk, nbr) in lnk_nbrs if nbr == node2]
-
-            # If lnks_to_node_2 is non-empty it will have one element: (lnk, node_2)
-            if lnks_to_node_2:
-                path = current_path + lnks_to_node_2
-                # Extract the links, but drop the None at the beginning.
-                lnks = [lnk for (lnk, _nbr) in path[1:]]
-                return lnks
-
-            # Not done. Add the newly reached nodes to visted.
-            visited |= {nbr for (_lnk, nbr) in lnk_nbrs}
-
-            # For each neighbor construct an extended version of the current path.
-            extended_paths = [current_path + [lnk_nbr] for lnk_nbr in lnk_nbrs]
-
-            # Add all those extended paths to the frontier.
-            frontier += extended_paths
+            node = frontier.popleft()
+            for lnk in agent_links.get(node, ()):
+                nbr = lnk.other_side(node)
+                if nbr in parent_links:
+                    continue
+                parent_links[nbr] = lnk
+                # Have we reached the target, node_2? If so, we've found a shortest path.
+                # Follow the parent links back to node_1 to extract it.
+                if nbr == node2:
+                    lnks = []
+                    while nbr is not node1:
+                        lnk = parent_links[nbr]
+                        lnks.append(lnk)
+                        nbr = lnk.other_side(nbr)
+                    return lnks[::-1]
+                frontier.append(nbr)
 
         # If we get out of the loop because the frontier is empty, there is no path from node_1 to node_2.
         return None
@@ -342,8 +511,7 @@ class Graph_World(World):
     def step(self):
         dist_unit = Graph_World.screen_distance_unit()
         if gui_get(LAYOUT) == FORCE_DIRECTED:
-            for node in World.agents:
-                node.adjust_distances(dist_unit, self.velocity_adjustment)
+            self.force_directed_step(dist_unit)
 
         self.compute_metrics()
 
@@ -31,6 +31,7 @@ SQUARE = 'square'
 STAR = 'star'
 
 FPS = 'fps'
+TICKS_PER_FRAME = 'ticks per frame'
 GO = 'go'
 GO_ONCE = 'go once'
 GOSTOP = 'GoStop'
@@ -87,6 +88,11 @@ def SCREEN_PIXEL_HEIGHT():
 
 FPS_VALUES = values = [1, 3, 6, 10, 15, 25, 40, 60]
 
+# How many ticks to run between redraws. AUTO_FRAME means run as many ticks as fit into one frame at the
+# current fps, i.e., redraw on a wall-clock budget of 1/fps seconds.
+AUTO_FRAME = 'auto'
+TICKS_PER_FRAME_VALUES = [1, 2, 5, 10, 25, 100, AUTO_FRAME]
+
 
 # The WINDOW variable will be available to refer to the WINDOW object from elsewhere in the code.
 # Neither the WINDOW nor the SCREEN can be imported directly because imports occur before they are created.
@@ -125,14 +131,80 @@ def draw_line(start_pixel, end_pixel, line_color: Color = Color('white'), width=
     line(gui.SCREEN, line_color, start_pixel, end_pixel, width)
 
 
+def set_board_dimensions(patch_size, board_rows_cols):
+    """ PATCH_SIZE, PATCH_ROWS, and PATCH_COLS must all be odd. Round them up if necessary. """
+    gui.PATCH_SIZE = patch_size if patch_size % 2 == 1 else patch_size + 1
+    gui.PATCH_ROWS = board_rows_cols[0] if board_rows_cols[0] % 2 == 1 else board_rows_cols[0] + 1
+    gui.PATCH_COLS = board_rows_cols[1] if board_rows_cols[1] % 2 == 1 else board_rows_cols[1] + 1
+
+
+def widget_defaults(layout):
+    """
+    Return a dictionary {key: default value} for the input widgets in a PySimpleGUI layout.
+    This is the dictionary gui.WINDOW.read() would return before the user touches anything.
+    Columns and Frames are searched recursively. Widgets without keys (and Text widgets) are skipped.
+    """
+    defaults = {}
+    for row in layout or []:
+        for element in (row if isinstance(row, list) else [row]):
+            if isinstance(element, (sg.Column, sg.Frame)):
+                defaults.update(widget_defaults(element.Rows))
+            elif element.Key is None:
+                continue
+            elif isinstance(element, (sg.Checkbox, sg.Radio)):
+                defaults[element.Key] = element.InitialState
+            elif isinstance(element, (sg.Slider, sg.Combo, sg.Spin)):
+                defaults[element.Key] = element.DefaultValue
+            elif isinstance(element, sg.InputText):
+                defaults[element.Key] = element.DefaultText
+    return defaults
+
+
+class HeadlessGUI:
+    """
+    Stands in for SimpleGUI when a model runs without a window. It sets up the same board dimensions
+    and a gui.SCREEN Surface (on SDL's dummy video driver, so nothing appears on the screen) but
+    creates no PySimpleGUI window. Agents still need gui.SCREEN for wrapping and for their images.
+    SDL_VIDEODRIVER is set to 'dummy' only if it isn't already set. close() restores its previous value.
+    """
+
+    def __init__(self, patch_size=11, board_rows_cols=(51, 51)):
+
+        set_board_dimensions(patch_size, board_rows_cols)
+
+        self.EXIT = 'Exit'
+        self.GRAPH = '-GRAPH-'
+        self.SETUP = 'setup'
+        self.STOP = 'Stop'
+
+        self.screen_shape_width_height = (SCREEN_PIXEL_WIDTH(), SCREEN_PIXEL_HEIGHT())
+
+        # False if SDL_VIDEODRIVER was already set, in which case it is left alone.
+        self.video_driver_set = 'SDL_VIDEODRIVER' not in os.environ
+        if self.video_driver_set:
+            os.environ['SDL_VIDEODRIVER'] = 'dummy'
+        pg.init()
+        gui.FONT = SysFont(None, int(1.5 * gui.BLOCK_SPACING()))
+        gui.SCREEN = pg.display.set_mode(self.screen_shape_width_height)
+
+    def close(self):
+        """ Undo the change, if any, to the process's SDL_VIDEODRIVER. """
+        if self.video_driver_set:
+            os.environ.pop('SDL_VIDEODRIVER', None)
+            self.video_driver_set = False
+
+    @staticmethod
+    def fill_screen():
+        pass
+
+
 class SimpleGUI:
 
     def __init__(self, gui_left_upper, gui_right_upper=None, caption="Basic Model",
-                 patch_size=15, board_rows_cols=(51, 51), clear=None, bounce=None, fps=None):
+                 patch_size=15, board_rows_cols=(51, 51), clear=None, bounce=None, fps=None,
+                 ticks_per_frame=None):
 
-        gui.PATCH_SIZE = patch_size if patch_size % 2 == 1 else patch_size + 1
-        gui.PATCH_ROWS = board_rows_cols[0] if board_rows_cols[0] % 2 == 1 else board_rows_cols[0] + 1
-        gui.PATCH_COLS = board_rows_cols[1] if board_rows_cols[1] % 2 == 1 else board_rows_cols[1] + 1
+        set_board_dimensions(patch_size, board_rows_cols)
 
         self.EXIT = 'Exit'
         self.GRAPH = '-GRAPH-'
@@ -147,7 +219,7 @@ class SimpleGUI:
 
         # All these gui.<variable> elements are globals in this file.
         gui.WINDOW = self.make_window(caption, gui_left_upper, gui_right_upper=gui_right_upper,
-                                      clear=clear, bounce=bounce, fps=fps)
+                                      clear=clear, bounce=bounce, fps=fps, ticks_per_frame=ticks_per_frame)
         pg.init()
         gui.FONT = SysFont(None, int(1.5 * gui.BLOCK_SPACING()))
 
@@ -158,7 +230,8 @@ class SimpleGUI:
     def fill_screen():
         gui.SCREEN.fill(pg.Color(gui.SCREEN_COLOR))
 
-    def make_window(self, caption, gui_left_upper, gui_right_upper=None, clear=None, bounce=True, fps=None):
+    def make_window(self, caption, gui_left_upper, gui_right_upper=None, clear=None, bounce=True, fps=None,
+                    ticks_per_frame=None):
         """
         Create the window, including sg.Graph, the drawing surface.
         """
@@ -182,6 +255,16 @@ class SimpleGUI:
                                    default_value=fps, visible=bool(fps), pad=((0, 0), (17, 0)), enable_events=True)
                           ]
 
+        # Similarly, always a ticks/frame combo box, visible only if the user specifies one.
+        tt = 'The number of ticks to run between redraws of the world.\n' \
+             f'"{AUTO_FRAME}" means redraw once per frame at the current frames/second.'
+        ticks_per_frame_line = [sg.Text('Ticks/frame', tooltip=tt, visible=bool(ticks_per_frame),
+                                        pad=((0, 10), (10, 0))),
+                                sg.Combo(key=gui.TICKS_PER_FRAME, values=TICKS_PER_FRAME_VALUES, tooltip=tt,
+                                         default_value=ticks_per_frame if ticks_per_frame else 1,
+                                         visible=bool(ticks_per_frame), pad=((0, 0), (10, 0)), enable_events=True)
+                                ]
+
         setup_go_line = [
             sg.Button(self.SETUP, pad=((0, 10), (10, 0))),
             sg.Button(gui.GO_ONCE, disabled=True, button_color=('white', 'green'), pad=((0, 10), (10, 0))),
@@ -197,6 +280,7 @@ class SimpleGUI:
                  setup_go_line,
                  clear_line,
                  fps_combo_line,
+                 ticks_per_frame_line,
                  gui.HOR_SEP(),
                  exit_button_line
                  ]
@@ -1,14 +1,15 @@
 
 from __future__ import annotations
 
-from random import sample
+from random import random
 from time import sleep
 
+import numpy as np
 from pygame.color import Color
 
 import core.gui as gui
 from core.agent import Agent
-from core.pairs import XY
+from core.pairs import Topology, XY, distance_matrix, wrap_around
 from core.sim_engine import gui_set, SimEngine
 from core.world_patch_block import World
 
@@ -19,7 +20,8 @@ class Link:
                  color: Color = Color('white'), width: int = 1):
         if None in {agent_1, agent_2}:
             raise Exception(f"Can't link to None: agent_1: {agent_1}, agent_2: {agent_2}.")
-        (self.agent_1, self.agent_2) = (agent_1, agent_2) if directed else sample((agent_1, agent_2), 2)
+        # An undirected link's ends are put in random order.
+        (self.agent_1, self.agent_2) = (agent_1, agent_2) if directed or random() < 0.5 else (agent_2, agent_1)
         self.both_sides = {agent_1, agent_2}
         if len(self.both_sides) != 2:
             raise Exception(f"Can't have a link from a node to itself: {agent_1} == {agent_2}.")
@@ -29,6 +31,10 @@ class Link:
         self.default_color = color
         self.color = color
         self.width = width
+        # See length, below.
+        self.cached_length = None
+        self.length_key = None
+        self.length_world_key = None
         if add_to_world_links:
             World.links.add(self)
 
@@ -72,7 +78,19 @@ class Link:
 
     @property
     def length(self) -> float:
-        return round(self.agent_1.distance_to(self.agent_2), 1)
+        """
+        The length is cached. It's recomputed only if one of the link's agents has moved or the topology
+        (whether distances wrap, and at what size) has changed since it was computed. If no agent at all has moved
+        (Agent.total_moves is unchanged) and the topology is the same, not even the agents have to be checked.
+        """
+        topology = (wrap_around(), Topology.size)
+        world_key = (Agent.total_moves, topology)
+        if self.length_world_key != world_key:
+            self.length_world_key = world_key
+            key = (self.agent_1.moves, self.agent_2.moves, topology)
+            if key != self.length_key:
+                (self.length_key, self.cached_length) = (key, round(self.agent_1.distance_to(self.agent_2), 1))
+        return self.cached_length
 
     def other_side(self, node):
         return (self.both_sides - {node}).pop()
@@ -121,6 +139,25 @@ def draw_links(links, sleep_time=0.6):
     World.links = cached_world_links_set
 
 
+def create_links(agents_1, agents_2, directed=False, color: Color = Color('white'), width: int = 1, link_class=Link):
+    """
+    Create a link from each agent in agents_1 to the corresponding agent in agents_2 and add them all to World.links
+    at once. agents_1 and agents_2 are sequences (e.g., lists or NumPy object arrays) of the same length.
+    Returns the list of the links in World.links for the pairs, in order. For a pair that was already linked
+    (or that appears more than once), that is the existing link, not a new one.
+    """
+    links = [link_class(agent_1, agent_2, directed=directed, add_to_world_links=False, color=color, width=width)
+             for (agent_1, agent_2) in zip(agents_1, agents_2)]
+    link_set = World.link_set()
+    link_set.update(links)
+    return [link_set.hashed_links[lnk.hash_object] for lnk in links]
+
+
+def delete_links(links):
+    """ Remove links from World.links all at once. """
+    World.link_set().difference_update(links)
+
+
 def hash_object(agent_1, agent_2, directed=False):
     return (agent_1, agent_2) if directed else frozenset({agent_1, agent_2})
 
@@ -129,40 +166,65 @@ def link_exists(agent_1, agent_2, directed=False):
     """
     Determine whether a directed/undirected link between agent_1 and agent_2 already exists in World.links.
 
-    The strategy is to create a hash_object of the possible link and then see if any existing link has
-    the same hash_object.
+    The strategy is to create a hash_object of the possible link and then look up the link, if any, with
+    the same hash_object. World.links keeps a dictionary of its links by hash_object.
     """
     hash_obj = hash_object(agent_1, agent_2, directed)
-    links = [lnk for lnk in World.links if lnk.hash_object == hash_obj]
-    return links[0] if links else None
+    return World.link_set().link_with_hash_object(hash_obj)
 
 
 def is_reachable_via(agent_1, link_list, agent_2) -> bool:
+    # Index the links by agent once rather than scanning link_list at each agent.
+    agent_links = {}
+    for lnk in link_list:
+        for agent in (lnk.agent_1, lnk.agent_2):
+            agent_links.setdefault(agent, []).append(lnk)
     seen = {agent_1}
     frontier = [agent_1]
     while frontier:
-        agent = frontier.pop(0)
-        seen.add(agent)
-        new_nghbrs = [lnk.other_side(agent) for lnk in link_list
-                      if lnk.includes(agent) and lnk.other_side(agent) not in seen]
-        if agent_2 in new_nghbrs:
-            return True
-        frontier.extend(new_nghbrs)
+        agent = frontier.pop()
+        for lnk in agent_links.get(agent, []):
+            nghbr = lnk.other_side(agent)
+            # agent_1 is seen from the start, so an agent is never reachable from itself.
+            if nghbr not in seen:
+                if nghbr == agent_2:
+                    return True
+                seen.add(nghbr)
+                frontier.append(nghbr)
     return False
 
 
 def minimum_spanning_tree(agent_list):
+    """
+    Kruskal's algorithm. Consider the pairs of agents in order of distance (ties in the order (0, 1), (0, 2), ...,
+    (1, 2), ...). Link a pair if its agents are not yet connected, i.e., not in the same union-find tree.
+    Only the links in the tree are created. The distances are computed all at once by pairs.distance_matrix.
+    """
     len_agent_list = len(agent_list)
-    all_links = [Link(agent_list[i], agent_list[j], add_to_world_links=False, color=Color('green'), width=2)
-                 for i in range(len_agent_list - 1)
-                 for j in range(i + 1, len_agent_list)]
-    sorted_links = sorted(all_links, key=lambda lnk: lnk.length)
-    reachable_points = set()
+    (firsts, seconds) = np.triu_indices(len_agent_list, 1)
+    lengths = distance_matrix([agent.center_pixel for agent in agent_list])[firsts, seconds]
+    # Sort by length rounded as Link.length rounds it.
+    order = np.argsort(np.round(lengths, 1), kind='stable')
+
+    # The union-find trees: parents[i] is i for a root.
+    parents = list(range(len_agent_list))
+
+    def root(i):
+        while parents[i] != i:
+            # Path halving: point i at its grandparent on the way up.
+            parents[i] = parents[parents[i]]
+            i = parents[i]
+        return i
+
     link_list = []
-    for lnk in sorted_links:
-        if not is_reachable_via(lnk.agent_1, link_list, lnk.agent_2):
-            link_list.append(lnk)
-            reachable_points |= {lnk.agent_1, lnk.agent_2}
+    for (i, j) in zip(firsts[order].tolist(), seconds[order].tolist()):
+        if len(link_list) == len_agent_list - 1:
+            break
+        (root_i, root_j) = (root(i), root(j))
+        if root_i != root_j:
+            parents[root_j] = root_i
+            link_list.append(Link(agent_list[i], agent_list[j], add_to_world_links=False, color=Color('green'),
+                                  width=2))
     return link_list
 
 
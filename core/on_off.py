@@ -43,7 +43,9 @@ class OnOffWorld(World):
         color_string = gui_get(key)
         if color_string in {'None', '', None}:
             color_string = default_color_string
-        button.update(button_color=(color_string, color_string))
+        # The color choosers are not part of a window when running headless.
+        if not SimEngine.headless:
+            button.update(button_color=(color_string, color_string))
         color = Color(color_string)
         return color
 
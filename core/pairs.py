@@ -5,6 +5,8 @@ from functools import lru_cache
 from math import copysign, hypot
 from random import choice, randint
 
+import numpy as np
+
 import core.gui as gui
 import core.utils as utils
 from core.sim_engine import gui_get
@@ -13,6 +15,9 @@ from core.utils import normalize_dxdy
 
 class XY(tuple):
 
+    # Pairs are immutable values. Without a __dict__ they are no bigger than plain tuples.
+    __slots__ = ()
+
     def __add__(self, xy: XY):
         sum = (self.x + xy.x, self.y + xy.y)
         return self.restore_type(sum)
@@ -68,6 +73,8 @@ class XY(tuple):
 
 class Pixel_xy(XY):
 
+    __slots__ = ()
+
     # Will be set to Pixel_xy(0, 0) after the Pixel_xy class is defined.
     pixel_xy_00 = None
 
@@ -79,23 +86,7 @@ class Pixel_xy(XY):
         return closest
 
     def distance_to(self, other: Pixel_xy):
-        # Try all ways to get there possibly including wrapping around.
-        bounce = gui_get('Bounce?')
-        wrap = bounce is not None and not bounce
-
-        # Can't do this directly since importing World would be circular
-        end_pts = [(self, other)]
-        if wrap:
-            screen_width = gui.SCREEN_PIXEL_WIDTH()
-            screen_height = gui.SCREEN_PIXEL_HEIGHT()
-            wrapped_end_pts = [((self+a+b).wrap3(screen_width, screen_height),
-                                (other+a+b).wrap3(screen_width, screen_height))
-                               for a in [Pixel_xy.pixel_xy_00, Pixel_xy((screen_width/2, 0))]
-                               for b in [Pixel_xy.pixel_xy_00, Pixel_xy((0, screen_height/2))]
-                               ]
-            end_pts += wrapped_end_pts
-        dist = min(hypot(start.x - end.x, start.y - end.y) for (start, end) in end_pts)
-        return dist
+        return distance(self, other)
 
     def heading_toward(self, to_pixel: Pixel_xy):
         """ The heading to face from the from_pixel to the to_pixel """
@@ -134,6 +125,8 @@ Pixel_xy.pixel_xy_00 = Pixel_xy((0, 0))
 
 class RowCol(XY):
 
+    __slots__ = ()
+
     def __str__(self):
         return f'RowCol{self.row, self.col}'
 
@@ -161,6 +154,8 @@ class RowCol(XY):
 
 class Velocity(XY):
 
+    __slots__ = ()
+
     velocity_00 = None
 
     def __str__(self):
@@ -227,6 +222,267 @@ def force_as_dxdy(pixel_a: Pixel_xy, pixel_b: Pixel_xy, screen_distance_unit=8,
         return final_force
 
 
+# Barnes-Hut parameters. See repulsive_forces().
+# A quadtree cell acts on a pixel as a single body at the cell's center of mass if the cell's width
+# is less than theta times the distance from the pixel to that center of mass.
+BARNES_HUT_THETA = 0.5
+# With fewer pixels than this, repulsive_forces() simply sums over all the pairs.
+EXACT_BELOW = 500
+# Quadtree cells with no more than LEAF_SIZE pixels, or at depth MAX_DEPTH, are not subdivided.
+LEAF_SIZE = 8
+MAX_DEPTH = 16
+
+
+def displacements(xys_a, xys_b) -> np.ndarray:
+    """
+    The (dx, dy) displacements xys_a - xys_b, broadcast as in distances(). If the world wraps, they are the
+    minimum-image displacements, i.e., along each axis the shorter of the direct way and the way around the edge.
+    """
+    deltas = np.asarray(xys_a, dtype=float) - np.asarray(xys_b, dtype=float)
+    if wrap_around():
+        size = np.array(Topology.size, dtype=float)
+        deltas -= size * np.round(deltas / size)
+    return deltas
+
+
+def attraction(deltas, screen_distance_unit, att_coefficient, att_exponent) -> np.ndarray:
+    """
+    The vectorized version of force_as_dxdy(repulsive=False). deltas is an (n, 2) array of displacements
+    pixel_a - pixel_b. The result is the (n, 2) array of forces on the pixel_a's.
+    """
+    directions = force_directions(-deltas)
+    d = np.maximum(1, np.hypot(deltas[:, 0], deltas[:, 1]))
+    dist = np.maximum(1, np.maximum(d, screen_distance_unit) / screen_distance_unit)
+    forces = directions * (dist**att_exponent)[:, np.newaxis]
+    # If the link is too short, push away instead of attracting.
+    forces[d < screen_distance_unit] *= -1
+    return forces * 10**(att_coefficient-1)
+
+
+def force_directions(deltas) -> np.ndarray:
+    """ The directions force_as_dxdy uses for an (n, 2) array of displacements. """
+    # As in normalize_dxdy(), scale each displacement so that its larger component has magnitude 1.
+    largest = np.abs(deltas).max(axis=1, keepdims=True)
+    directions = deltas / np.where(largest == 0, 1, largest)
+    no_direction = directions.sum(axis=1) == 0
+    directions[no_direction] = np.random.randint(-1, 2, (np.count_nonzero(no_direction), 2))
+    return directions
+
+
+def repulsion(deltas, screen_distance_unit, rep_coefficient, rep_exponent, dists=None) -> np.ndarray:
+    """
+    The vectorized version of force_as_dxdy(repulsive=True). deltas is an (n, 2) array of displacements
+    pixel_a - pixel_b. The result is the (n, 2) array of forces on the pixel_a's.
+    dists, if given, are the distances to use instead of the lengths of deltas.
+    """
+    directions = force_directions(deltas)
+    dists = np.hypot(deltas[:, 0], deltas[:, 1]) if dists is None else dists
+    dist = np.maximum(1, dists / screen_distance_unit)
+    return directions * (((10**rep_coefficient)/10) * dist**rep_exponent)[:, np.newaxis]
+
+
+def repulsive_forces(xys, screen_distance_unit=8, radius=None, theta=BARNES_HUT_THETA,
+                     exact_below=EXACT_BELOW, rep_coefficient=None, rep_exponent=None) -> np.ndarray:
+    """
+    The sum, for each pixel in xys, of the repulsive forces (as in force_as_dxdy) on it from the other pixels,
+    or, if radius is given, from the other pixels closer than radius. The result is an (n, 2) array in xys order.
+
+    With fewer than exact_below pixels the sums are exact. Otherwise the forces are approximated by the
+    Barnes-Hut method: a quadtree cell that is small relative to its distance from a pixel (see BARNES_HUT_THETA)
+    is treated as a single body. That takes O(n log n) rather than O(n**2) time. theta=0 makes the sums exact.
+    If the world wraps, the forces act along the minimum-image displacements.
+    rep_coefficient and rep_exponent default to the gui values, as in force_as_dxdy.
+    """
+    xys = np.asarray(xys, dtype=float).reshape(-1, 2)
+    rep_coefficient = gui_get(REP_COEFF, 1) if rep_coefficient is None else rep_coefficient
+    rep_exponent = gui_get(REP_EXPONENT, 2) if rep_exponent is None else rep_exponent
+
+    def force(deltas):
+        return repulsion(deltas, screen_distance_unit, rep_coefficient, rep_exponent)
+
+    if len(xys) < exact_below:
+        (i, j) = np.nonzero(~np.eye(len(xys), dtype=bool))
+        deltas = displacements(xys[i], xys[j])
+        if radius is not None:
+            in_radius = np.hypot(deltas[:, 0], deltas[:, 1]) < radius
+            (i, deltas) = (i[in_radius], deltas[in_radius])
+        return sum_by_index(i, force(deltas), len(xys))
+    return Quadtree(xys).sum_forces(force, theta, radius)
+
+
+def sum_by_index(indices, forces, n) -> np.ndarray:
+    """ An (n, 2) array whose row i is the sum of the forces[k] for which indices[k] is i. """
+    return np.column_stack([np.bincount(indices, weights=forces[:, 0], minlength=n),
+                            np.bincount(indices, weights=forces[:, 1], minlength=n)])
+
+
+class Quadtree:
+    """
+    A quadtree over an (n, 2) array of pixels, built level by level with NumPy.
+
+    The pixels are sorted into Morton (z-) order, i.e., by their interleaved grid coordinates at depth MAX_DEPTH.
+    The pixels in any cell are then contiguous in that order. levels[depth] describes the cells at that depth
+    (the root is at depth 0) as arrays with one entry per cell: the range of the cell's pixels in the sorted order
+    (start, count), its center of mass (com), its grid coordinates (grid), whether it's a leaf, and the range
+    of its children in the next level (first_child, end_child).
+    """
+
+    def __init__(self, xys, leaf_size=LEAF_SIZE, max_depth=MAX_DEPTH):
+        self.origin = xys.min(axis=0)
+        # Widen the root a bit so that the largest coordinates fall inside it.
+        self.width = max(1.0, np.ptp(xys, axis=0).max()) * (1 + 1e-9)
+        grid = np.minimum(((xys - self.origin) / self.width * 2**max_depth).astype(np.int64), 2**max_depth - 1)
+        codes = np.zeros(len(xys), dtype=np.int64)
+        for bit in range(max_depth):
+            codes |= ((grid[:, 0] >> bit) & 1) << (2*bit) | ((grid[:, 1] >> bit) & 1) << (2*bit + 1)
+        self.order = np.argsort(codes, kind='stable')
+        (self.xys, codes, grid) = (xys[self.order], codes[self.order], grid[self.order])
+
+        self.levels = []
+        for depth in range(max_depth + 1):
+            keys = codes >> 2*(max_depth - depth)
+            start = np.flatnonzero(np.concatenate([[True], keys[1:] != keys[:-1]]))
+            count = np.diff(np.append(start, len(xys)))
+            level = {'start': start, 'count': count,
+                     'com': np.add.reduceat(self.xys, start, axis=0) / count[:, np.newaxis],
+                     'grid': grid[start] >> (max_depth - depth),
+                     'leaf': (count <= leaf_size) | (depth == max_depth)}
+            if self.levels:
+                parent = self.levels[-1]
+                parent['first_child'] = np.searchsorted(start, parent['start'])
+                parent['end_child'] = np.searchsorted(start, parent['start'] + parent['count'])
+            self.levels.append(level)
+            if level['leaf'].all():
+                break
+
+    def sum_forces(self, force, theta=BARNES_HUT_THETA, radius=None) -> np.ndarray:
+        """
+        For each pixel, the sum of force(displacement) over the other pixels (those closer than radius, if given).
+        force maps an (m, 2) array of displacements to an (m, 2) array of forces. A cell far enough away, by the
+        Barnes-Hut criterion, and (if radius is given) entirely within radius, contributes
+        count * force(displacement to its center of mass). Returns an (n, 2) array in the order of the xys
+        the Quadtree was built from.
+        """
+        n = len(self.xys)
+        totals = np.zeros((n, 2))
+        # The (pixel, cell) pairs to examine at the current depth. Pixels are identified by their sorted positions.
+        (pixels, cells) = (np.arange(n), np.zeros(n, dtype=np.int64))
+        for (depth, level) in enumerate(self.levels):
+            if not len(pixels):
+                break
+            (start, count) = (level['start'][cells], level['count'][cells])
+            deltas = displacements(self.xys[pixels], level['com'][cells])
+            cell_width = self.width / 2**depth
+            contains_pixel = (start <= pixels) & (pixels < start + count)
+            far = ~contains_pixel & (cell_width < theta * np.hypot(deltas[:, 0], deltas[:, 1]))
+            to_open = ~far
+            if radius is not None:
+                # Only a cell entirely within radius can act as a single body. A cell entirely beyond radius
+                # is dropped. A cell that straddles the radius boundary is opened, however far away it is.
+                (nearest, farthest) = self.distances_to_cells(pixels, level['grid'][cells], cell_width)
+                far &= farthest < radius
+                to_open = ~far & (nearest < radius)
+            totals += sum_by_index(pixels[far], count[far, np.newaxis] * force(deltas[far]), n)
+
+            # Leaves are opened into (pixel, pixel) pairs and summed exactly.
+            leaf = to_open & level['leaf'][cells]
+            (leaf_pixels, others) = expand(pixels[leaf], start[leaf], count[leaf])
+            deltas = displacements(self.xys[leaf_pixels], self.xys[others])
+            keep = leaf_pixels != others
+            if radius is not None:
+                keep &= np.hypot(deltas[:, 0], deltas[:, 1]) < radius
+            totals += sum_by_index(leaf_pixels[keep], force(deltas[keep]), n)
+
+            # Other cells are opened into (pixel, child) pairs at the next depth. The deepest level is all leaves.
+            inner = to_open & ~level['leaf'][cells]
+            if not inner.any():
+                break
+            first_child = level['first_child'][cells[inner]]
+            (pixels, cells) = expand(pixels[inner], first_child, level['end_child'][cells[inner]] - first_child)
+
+        forces = np.empty_like(totals)
+        forces[self.order] = totals
+        return forces
+
+    def distances_to_cells(self, pixels, grid, cell_width):
+        """ The distances from the pixels to the nearest and farthest points of the cells at grid coordinates. """
+        centers = self.origin + (grid + 0.5) * cell_width
+        offsets = np.abs(displacements(self.xys[pixels], centers))
+        nearest = np.maximum(offsets - cell_width/2, 0)
+        farthest = offsets + cell_width/2
+        return (np.hypot(nearest[:, 0], nearest[:, 1]), np.hypot(farthest[:, 0], farthest[:, 1]))
+
+
+def expand(items, firsts, counts):
+    """ Pair each items[i] with each of firsts[i], firsts[i]+1, ..., firsts[i]+counts[i]-1. Return two arrays. """
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    return (np.repeat(items, counts), np.repeat(firsts, counts) + offsets)
+
+
+class Topology:
+    """
+    What distance computations need to know about the world: whether distances wrap around the screen edges and,
+    if so, the width and height at which they wrap. Reading the Bounce? widget on every distance would be slow.
+    Instead it's read on first use after each refresh(), which World calls once per tick.
+    """
+
+    size = None
+    wrap = None
+
+    @staticmethod
+    def read():
+        bounce = gui_get('Bounce?')
+        Topology.wrap = bounce is not None and not bounce
+        # Positions wrap at one pixel less than the screen size. See Pixel_xy.wrap().
+        Topology.size = (gui.SCREEN_PIXEL_WIDTH() - 1, gui.SCREEN_PIXEL_HEIGHT() - 1)
+
+    @staticmethod
+    def refresh():
+        Topology.wrap = None
+
+
+def distance(xy_1, xy_2) -> float:
+    """
+    The distance between pixels xy_1 and xy_2. If the world wraps, it's the minimum-image distance: along each
+    axis, the shorter of the direct way and the way around the edge.
+    """
+    dx = abs(xy_1[0] - xy_2[0])
+    dy = abs(xy_1[1] - xy_2[1])
+    if wrap_around():
+        (width, height) = Topology.size
+        (dx, dy) = (dx % width, dy % height)
+        (dx, dy) = (min(dx, width - dx), min(dy, height - dy))
+    return hypot(dx, dy)
+
+
+def distance_matrix(xys, other_xys=None) -> np.ndarray:
+    """ The array of distances [i, j] from xys[i] to other_xys[j], or to xys[j] if other_xys is None. """
+    xys = np.asarray(xys, dtype=float)
+    other_xys = xys if other_xys is None else np.asarray(other_xys, dtype=float)
+    return distances(xys[:, np.newaxis, :], other_xys[np.newaxis, :, :])
+
+
+def distances(xy, xys) -> np.ndarray:
+    """
+    The vectorized version of distance(). xy and xys are pixels, or arrays of pixels whose last dimension is (x, y),
+    and are broadcast against each other. E.g., if xy is a pixel and xys has shape (n, 2), the result is the n
+    distances from xy.
+    """
+    deltas = np.abs(np.asarray(xys, dtype=float) - np.asarray(xy, dtype=float))
+    if wrap_around():
+        size = np.array(Topology.size, dtype=float)
+        deltas %= size
+        deltas = np.minimum(deltas, size - deltas)
+    return np.hypot(deltas[..., 0], deltas[..., 1])
+
+
+def wrap_around():
+    """ Do distances wrap around the screen edges? Only if there is a Bounce? widget and it's off. """
+    if Topology.wrap is None:
+        Topology.read()
+    return Topology.wrap
+
+
 def heading_and_speed_to_velocity(heading, speed) -> Velocity:
     unit_dxdy = heading_to_unit_dxdy(heading)
     velocity = unit_dxdy * speed
@@ -244,6 +500,25 @@ def heading_to_unit_dxdy(heading) -> Velocity:
     return vel
 
 
+def headings_toward(dxdys) -> np.ndarray:
+    """
+    The vectorized version of utils.dxdy_to_heading for an (n, 2) array of (dx, dy)'s. Returns int headings,
+    as Agent.set_heading() keeps them, with 0 for (0, 0).
+    """
+    largest = np.abs(dxdys).max(axis=1)
+    scale = np.where(largest == 0, 1, largest)
+    # As in utils.atan2(). The (-1) compensates for the inverted y-axis.
+    angles = np.degrees(np.arctan2(np.rint(100*(-1)*dxdys[:, 1]/scale), np.rint(100*dxdys[:, 0]/scale)))
+    return np.where(largest == 0, 0, np.rint(90 - angles) % 360).astype(int)
+
+
+def headings_to_unit_dxdys(headings) -> np.ndarray:
+    """ The vectorized version of heading_to_unit_dxdy. Returns an (n, 2) array. """
+    radians = np.radians(np.rint(90 - np.asarray(headings)) % 360)
+    # The -1 accounts for the y-axis being inverted.
+    return np.column_stack([np.cos(radians), (-1) * np.sin(radians)])
+
+
 if __name__ == "__main__":
 
     # Various tests and experiments
@@ -0,0 +1,138 @@
+"""
+Opt-in per-tick timing of the main parts of a run: the step, the drawing (split into patches, links,
+and agents), polling the gui window, and the frame-rate limit.
+
+Profiling is turned on by passing profile=True (or profile=<csv file name>) to PyLogo or PyLogo_headless.
+That creates a Profiler and makes it Profiler.active. Code to be timed is wrapped in
+
+    with timed(STEP):
+        ...
+
+which does nothing (other than run the code) when no Profiler is active. The times for each section are
+summed over a tick and kept for the most recent ticks. At the end of a run, print_report() prints a
+summary and a histogram for each section. If a file name was given, each tick's times are also
+written to that file as a line of csv.
+"""
+
+from collections import deque
+from contextlib import contextmanager
+from statistics import mean
+from time import perf_counter
+
+# The sections that are timed.
+STEP = 'step'
+DRAW = 'draw'
+DRAW_PATCHES = 'draw patches'
+DRAW_LINKS = 'draw links'
+DRAW_AGENTS = 'draw agents'
+GUI_READ = 'gui read'
+CLOCK_TICK = 'clock tick'
+
+SECTIONS = [STEP, DRAW, DRAW_PATCHES, DRAW_LINKS, DRAW_AGENTS, GUI_READ, CLOCK_TICK]
+
+# Upper bounds (in milliseconds) of the histogram buckets. The last bucket is everything larger.
+BUCKET_LIMITS = [0.1, 0.3, 1, 3, 10, 30, 100]
+
+
+class Profiler:
+
+    # The Profiler in use, if any.
+    active = None
+
+    def __init__(self, window=1000, file_name=None):
+        """
+        window is the number of most recent ticks to keep.
+        file_name, if given, is a csv file to which each tick's times are streamed.
+        """
+        self.current = dict.fromkeys(SECTIONS, 0.0)
+        self.samples = {section: deque(maxlen=window) for section in SECTIONS}
+        self.tick = None
+        self.stream = None
+        if file_name:
+            self.stream = open(file_name, 'w')
+            self.stream.write(','.join(['tick'] + SECTIONS) + '\n')
+
+    def add(self, section, seconds):
+        self.current[section] += seconds
+
+    def close(self):
+        self.end_tick()
+        if self.stream:
+            self.stream.close()
+            self.stream = None
+
+    def end_tick(self):
+        """ Save the times accumulated for the current tick, if any, and start over. """
+        if self.tick is not None:
+            for section in SECTIONS:
+                self.samples[section].append(self.current[section])
+            if self.stream:
+                times = [f'{1000*self.current[section]:.3f}' for section in SECTIONS]
+                self.stream.write(','.join([str(self.tick)] + times) + '\n')
+        self.current = dict.fromkeys(SECTIONS, 0.0)
+
+    @staticmethod
+    def histogram(times_ms):
+        counts = [0] * (len(BUCKET_LIMITS) + 1)
+        for t in times_ms:
+            bucket = next((i for (i, limit) in enumerate(BUCKET_LIMITS) if t < limit), len(BUCKET_LIMITS))
+            counts[bucket] += 1
+        return counts
+
+    def new_tick(self, tick):
+        self.end_tick()
+        self.tick = tick
+
+    def print_report(self):
+        """ Print the mean, median, 95th percentile and maximum time (in ms) and a histogram for each section. """
+        self.end_tick()
+        self.tick = None
+        labels = [f'<{limit}' for limit in BUCKET_LIMITS] + [f'>={BUCKET_LIMITS[-1]}']
+        print(f'\nProfile (ms per tick over the last {max(len(s) for s in self.samples.values())} ticks)')
+        print(f'{"section":>13} {"mean":>8} {"median":>8} {"95%":>8} {"max":>8}   ' +
+              ' '.join(f'{label:>6}' for label in labels))
+        for section in SECTIONS:
+            times_ms = sorted(1000*t for t in self.samples[section])
+            if not times_ms or times_ms[-1] == 0:
+                continue
+            (median, pct_95) = (times_ms[len(times_ms)//2], times_ms[int(0.95*(len(times_ms)-1))])
+            print(f'{section:>13} {mean(times_ms):8.2f} {median:8.2f} {pct_95:8.2f} {times_ms[-1]:8.2f}   ' +
+                  ' '.join(f'{count:>6}' for count in self.histogram(times_ms)))
+
+
+def new_tick(tick):
+    """ Tell the active Profiler, if any, that a new tick has started. """
+    if Profiler.active:
+        Profiler.active.new_tick(tick)
+
+
+def start_profiling(profile):
+    """ profile is False/None (no profiling), True, or the name of a csv file to stream the times to. """
+    Profiler.active = Profiler(file_name=profile if isinstance(profile, str) else None) if profile else None
+
+
+def stop_profiling(close=False):
+    """
+    Print the report of the active Profiler, if any.
+    Unless close is True, profiling continues if the model is run again.
+    """
+    if Profiler.active:
+        Profiler.active.print_report()
+        if close:
+            Profiler.active.close()
+            Profiler.active = None
+        elif Profiler.active.stream:
+            Profiler.active.stream.flush()
+
+
+@contextmanager
+def timed(section):
+    """ Add the time spent in the body of the with statement to section of the active Profiler, if any. """
+    if Profiler.active is None:
+        yield
+        return
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        Profiler.active.add(section, perf_counter() - start)
@@ -1,10 +1,13 @@
 
+from time import perf_counter
+
 import pygame as pg
 from pygame.display import update
 from pygame.time import Clock
 
 import core.gui as gui
-from core.gui import FPS, GOSTOP, GO_ONCE, SimpleGUI
+from core.gui import AUTO_FRAME, FPS, GOSTOP, GO_ONCE, HeadlessGUI, SimpleGUI, TICKS_PER_FRAME, widget_defaults
+from core.profiler import CLOCK_TICK, DRAW, GUI_READ, STEP, new_tick, start_profiling, stop_profiling, timed
 
 
 class SimEngine:
@@ -13,6 +16,10 @@ class SimEngine:
 
     event = None
     fps = 60
+    # True when running without a window. See HeadlessSimEngine below.
+    headless = False
+    # The number of ticks to run between redraws, or AUTO_FRAME. See model_loop.
+    ticks_per_frame = 1
     values = None
 
     simple_gui = None
@@ -20,7 +27,8 @@ class SimEngine:
     
 
     def __init__(self, gui_left_upper, caption="Basic Model", gui_right_upper=None,
-                 patch_size=11, board_rows_cols=(51, 51), clear=None, bounce=None, fps=None):
+                 patch_size=11, board_rows_cols=(51, 51), clear=None, bounce=None, fps=None,
+                 ticks_per_frame=None, profile=None):
 
         # Constants for the main loop in start() below.
         self.CTRL_D = 'D:68'
@@ -32,19 +40,34 @@ class SimEngine:
 
         self.clock = Clock()
         SimEngine.fps = fps if fps else 60
+        SimEngine.ticks_per_frame = ticks_per_frame if ticks_per_frame else 1
         self.idle_fps = 10
 
         SimEngine.simple_gui = SimpleGUI(gui_left_upper, caption=caption, gui_right_upper=gui_right_upper,
                                          patch_size=patch_size, board_rows_cols=board_rows_cols,
-                                         clear=clear, bounce=bounce, fps=fps)
+                                         clear=clear, bounce=bounce, fps=fps, ticks_per_frame=ticks_per_frame)
         self.graph_point = None
 
+        # profile is False/None, True, or the name of a csv file. See core.profiler.
+        start_profiling(profile)
+
     @staticmethod
     def draw_world():
-        """ Fill the screen with the background color, draw the world, and update the display. """
-        SimEngine.simple_gui.fill_screen()
-        SimEngine.world.draw()
-        update()
+        """
+        Fill the screen with the background color, draw the world, and update the display.
+        After a step of a world that sets draw_changes_only, redraw and update only what changed.
+        """
+        with timed(DRAW):
+            world = SimEngine.world
+            changed_rects = world.draw_changes() if world.draw_changes_only and SimEngine.event == '__TIMEOUT__' \
+                            else None
+            if changed_rects is None:
+                SimEngine.simple_gui.fill_screen()
+                world.draw()
+                update()
+            else:
+                update(changed_rects)
+            world.reset_changes()
 
     @staticmethod
     def gui_get(key):
@@ -52,7 +75,7 @@ class SimEngine:
         Widgets typically have a 'disabled' property. The following makes
         it possible to use 'enabled' as the negation of 'disabled'.
         """
-        if not SimEngine.values:
+        if not SimEngine.values and not SimEngine.headless:
             (SimEngine.event, SimEngine.values) = gui.WINDOW.read(timeout=10)
         value = SimEngine.values.get(key, None) if key != 'enabled' else not SimEngine.values.get('disabled', None)
         return int(value) if value != float('inf') and isinstance(value, float) and value == int(value) else value
@@ -67,14 +90,36 @@ class SimEngine:
             value = kwargs.get('enabled')
             kwargs['disabled'] = not bool(value)
             kwargs.pop('enabled')
+        if SimEngine.headless:
+            headless_set(key, **kwargs)
+            return
         widget = gui.WINDOW[key]
         widget.update(**kwargs)
 
+    @staticmethod
+    def frame_due(ticks_since_draw, last_draw_time):
+        """
+        Should the world be redrawn after this tick? Yes if SimEngine.ticks_per_frame ticks have been
+        taken since the last redraw or, in AUTO_FRAME mode, if a frame's worth of time (1/fps) has passed.
+        """
+        if SimEngine.world.done:
+            return True
+        if SimEngine.ticks_per_frame == AUTO_FRAME:
+            return perf_counter() - last_draw_time >= 1/SimEngine.fps
+        return ticks_since_draw >= SimEngine.ticks_per_frame
+
     def model_loop(self):
 
+        # The number of ticks taken since the world was last drawn and when that happened.
+        ticks_since_draw = 0
+        last_draw_time = perf_counter()
+
         # Run this loop until the model signals it is finished or until the user stops it by pressing the Stop button.
         while True:
-            (SimEngine.event, SimEngine.values) = gui.WINDOW.read(timeout=10)
+            # Between redraws, just check for events. Don't wait for them.
+            timeout = 0 if ticks_since_draw else 10
+            with timed(GUI_READ):
+                (SimEngine.event, SimEngine.values) = gui.WINDOW.read(timeout=timeout)
 
             if SimEngine.event in (None, SimEngine.simple_gui.EXIT):
                 return SimEngine.simple_gui.EXIT
@@ -84,6 +129,9 @@ class SimEngine:
             if SimEngine.event == FPS:
                 SimEngine.fps = SimEngine.gui_get(FPS)
 
+            if SimEngine.event == TICKS_PER_FRAME:
+                SimEngine.ticks_per_frame = SimEngine.gui_get(TICKS_PER_FRAME)
+
             if SimEngine.event.startswith(SimEngine.simple_gui.GRAPH):
                 SimEngine.world.mouse_click(SimEngine.values['-GRAPH-'])
 
@@ -100,15 +148,24 @@ class SimEngine:
                 # This increments the World's tick counter for the number of times we have gone around this loop.
                 # Examples.starburst uses it to decide when to "explode." Look at its step method.
                 SimEngine.world.increment_ticks()
+                new_tick(SimEngine.world.ticks)
                 # Take a step in the simulation.
-                SimEngine.world.step()
+                with timed(STEP):
+                    SimEngine.world.step()
+                ticks_since_draw += 1
+                # Skip the redraw (and the frame-rate limit) until a frame is due.
+                if not self.frame_due(ticks_since_draw, last_draw_time):
+                    continue
                 # This line limits how fast the simulation runs. It is not a counter.
-                self.clock.tick(SimEngine.fps)
+                with timed(CLOCK_TICK):
+                    self.clock.tick(SimEngine.fps)
 
             else:
                 SimEngine.world.handle_event(SimEngine.event)
 
             SimEngine.draw_world()
+            ticks_since_draw = 0
+            last_draw_time = perf_counter()
 
         return self.NORMAL
 
@@ -140,6 +197,9 @@ class SimEngine:
             if SimEngine.event == FPS:
                 SimEngine.fps = SimEngine.gui_get(FPS)
 
+            if SimEngine.event == TICKS_PER_FRAME:
+                SimEngine.ticks_per_frame = SimEngine.gui_get(TICKS_PER_FRAME)
+
             if not SimEngine.auto_setup and SimEngine.event == '__TIMEOUT__':
                 continue
 
@@ -164,7 +224,9 @@ class SimEngine:
                 SimEngine.gui_set(GO_ONCE, enabled=False)
                 SimEngine.gui_set(SimEngine.simple_gui.SETUP, enabled=False)
                 SimEngine.world.increment_ticks()
-                SimEngine.world.step()
+                new_tick(SimEngine.world.ticks)
+                with timed(STEP):
+                    SimEngine.world.step()
                 SimEngine.gui_set(SimEngine.simple_gui.SETUP, enabled=True)
                 SimEngine.gui_set(GOSTOP, text='go', button_color=('white', 'green'), enabled=True)
                 SimEngine.gui_set(GO_ONCE, enabled=True)
@@ -178,6 +240,7 @@ class SimEngine:
                 SimEngine.gui_set(GO_ONCE, enabled=True)
                 SimEngine.gui_set(SimEngine.simple_gui.SETUP, enabled=True)
                 SimEngine.world.final_thoughts()
+                stop_profiling()
                 if returned_value == SimEngine.simple_gui.EXIT:
                     gui.WINDOW.close()
                     break
@@ -190,6 +253,105 @@ class SimEngine:
             self.clock.tick(self.idle_fps)
 
 
+class HeadlessSimEngine(SimEngine):
+    """
+    Runs a World without PySimpleGUI and without drawing anything.
+
+    gui_get is answered from SimEngine.values, a plain dictionary. It starts with the defaults of the
+    widgets in gui_left_upper and gui_right_upper (and of the Clear?/Bounce?/fps widgets SimpleGUI
+    would have created), which parameters then overrides. gui_set(key, value=...) writes into the same
+    dictionary, just as updating a widget changes what gui.WINDOW.read() returns.
+
+    Worlds that talk to the window directly find a HeadlessWindow in gui.WINDOW.
+
+    run() calls setup() and then step() in a tight loop until the World is done or max_ticks is reached.
+    There is no clock.tick() throttling and no window polling.
+    """
+
+    def __init__(self, gui_left_upper=None, gui_right_upper=None, parameters=None,
+                 patch_size=11, board_rows_cols=(51, 51), clear=None, bounce=None, fps=None, profile=None):
+
+        SimEngine.headless = True
+        SimEngine.fps = fps if fps else 60
+        SimEngine.simple_gui = HeadlessGUI(patch_size=patch_size, board_rows_cols=board_rows_cols)
+
+        values = widget_defaults(gui_left_upper)
+        values.update(widget_defaults(gui_right_upper))
+        (bounce_value, _visibility) = bounce if isinstance(bounce, tuple) else (bounce, True)
+        values.update({'Clear?': clear, 'Bounce?': bounce_value, FPS: fps, 'Grab': False})
+        if parameters:
+            values.update(parameters)
+        SimEngine.values = values
+        SimEngine.event = '__TIMEOUT__'
+        gui.WINDOW = HeadlessWindow()
+
+        start_profiling(profile)
+
+    @staticmethod
+    def run(the_world, max_ticks=None):
+        """
+        Set up the_world and step it until it is done or until max_ticks ticks have been taken.
+        Returns the_world so that callers can extract results from it.
+        """
+        SimEngine.world = the_world
+        # Nothing is drawn, so there are no changes to track.
+        the_world.draw_changes_only = False
+        the_world.reset_changes()
+        the_world.reset_all()
+        the_world.setup()
+        while not the_world.done and (max_ticks is None or the_world.ticks < max_ticks):
+            the_world.increment_ticks()
+            new_tick(the_world.ticks)
+            with timed(STEP):
+                the_world.step()
+        the_world.final_thoughts()
+        stop_profiling(close=True)
+        SimEngine.simple_gui.close()
+        return the_world
+
+
+class HeadlessElement:
+    """ What HeadlessWindow returns for any key: a widget whose update() and click() do nothing. """
+
+    def __init__(self, key):
+        self.key = key
+
+    def click(self):
+        pass
+
+    def update(self, *_args, **_kwargs):
+        pass
+
+
+class HeadlessWindow:
+    """
+    Stands in for gui.WINDOW when running headless. read() returns the current event and values rather
+    than polling a window, indexing returns a HeadlessElement, and close() does nothing.
+    """
+
+    def __getitem__(self, key):
+        return HeadlessElement(key)
+
+    def close(self):
+        pass
+
+    def grab_any_where_off(self):
+        pass
+
+    def grab_any_where_on(self):
+        pass
+
+    @staticmethod
+    def read(timeout=None):
+        return (SimEngine.event, SimEngine.values)
+
+
+def headless_set(key, **kwargs):
+    """ The headless version of updating a widget: record its new value, if any. Ignore everything else. """
+    if 'value' in kwargs:
+        SimEngine.values[key] = kwargs['value']
+
+
 def gui_get(key, default=None):
     """
     Get the values associated with the key. If None, return default.
@@ -211,6 +373,9 @@ def gui_set(key, **kwargs):
         value = kwargs.get('enabled')
         kwargs['disabled'] = not bool(value)
         kwargs.pop('enabled')
+    if SimEngine.headless:
+        headless_set(key, **kwargs)
+        return
     widget = gui.WINDOW[key]
     if widget is None:
         print(f'No widget with key {key}')
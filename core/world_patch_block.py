@@ -1,13 +1,19 @@
 
 from __future__ import annotations
 
+from functools import lru_cache
+from itertools import chain
 from math import sqrt
+from statistics import mean
+from sys import getsizeof
 from typing import Tuple
 
 import numpy as np
+from pygame import surfarray
 from pygame.color import Color
 from pygame.rect import Rect
 from pygame.surface import Surface
+from pygame.transform import scale
 
 import core.gui as gui
 import core.utils as utils
@@ -15,15 +21,51 @@ import core.utils as utils
 # noinspection PyUnresolvedReferences
 import core.world_patch_block as world
 from core.gui import SHAPES
-from core.pairs import Pixel_xy, RowCol, center_pixel
+from core.pairs import Pixel_xy, RowCol, Topology, center_pixel
+from core.profiler import DRAW_AGENTS, DRAW_LINKS, DRAW_PATCHES, timed
 from core.utils import get_class_name
 
+# The (row, col) offsets of the 4, 8, and 24 neighbors of a patch.
+NEIGHBOR_DELTAS = {4: ((-1, 0), (1, 0), (0, -1), (0, 1)),
+                   8: ((-1, 0), (1, 0), (0, -1), (0, 1), (-1, -1), (-1, 1), (1, -1), (1, 1)),
+                   24: ((-1, 0), (1, 0), (0, -1), (0, 1), (-1, -1), (-1, 1), (1, -1), (1, 1),
+                        (-2, -2), (-1, -2), (0, -2), (1, -2), (2, -2),
+                        (-2, -1), (2, -1),
+                        (-2, 0), (2, 0),
+                        (-2, 1), (2, 1),
+                        (-2, 2), (-1, 2), (0, 2), (1, 2), (2, 2),
+                        ),
+                   }
+
+
+@lru_cache(maxsize=32)
+def radius_deltas(radius):
+    """ The (row, col) offsets of the patches within radius (in patches) of a patch, nearest first. """
+    r = int(radius)
+    deltas = [(dr, dc) for dr in range(-r, r + 1) for dc in range(-r, r + 1)
+              if 0 < dr*dr + dc*dc <= radius*radius]
+    return tuple(sorted(deltas, key=lambda d: d[0]*d[0] + d[1]*d[1]))
+
+
+@lru_cache(maxsize=1024)
+def color_surface(size, rgba) -> Surface:
+    """ A size x size Surface filled with rgba. Patches of the same color share it. See Patch.image. """
+    surface = Surface((size, size))
+    surface.fill(rgba)
+    return surface
+
 
 class Block:
     """
     A generic patch/agent. Has a Pixel_xy but not necessarily a RowCol. Has a Color.
+
+    To keep patches and agents small, Block, Patch, and Agent declare their attributes in __slots__.
+    A model's subclass that doesn't declare __slots__ gets a __dict__ as usual, so it can add any attributes
+    it likes. (A subclass may declare its own __slots__ to stay compact.) See World.print_memory_report().
     """
 
+    __slots__ = ('_label', 'base_color', 'center_pixel', 'color', 'highlight', 'rect')
+
     agent_text_offset = int(1.5*gui.PATCH_SIZE)
     patch_text_offset = -int(1.0*gui.PATCH_SIZE)
 
@@ -33,7 +75,6 @@ class Block:
         # noinspection PyTypeChecker
         sum_pixel: Pixel_xy = center_pixel + Pixel_xy((1, 1))
         self.rect.center = sum_pixel
-        self.image = Surface((self.rect.w, self.rect.h))
         self.color = self.base_color = color
         self._label = None
         self.highlight = None
@@ -73,17 +114,24 @@ class Block:
 
     def set_color(self, color):
         self.color = color
-        self.image.fill(color)
 
 
 class Patch(Block):
+
+    __slots__ = ('_color_image', '_own_image', 'agents', 'flat_index', 'row_col')
+
     def __init__(self, row_col: RowCol, patch_color=Color('black')):
         super().__init__(row_col.patch_to_center_pixel(), color=patch_color)
+        # Center the rect now. It's where the patch appears even if it is drawn as part of the patch layer.
+        self.rect.center = self.center_pixel
         self.row_col = row_col
+        # This patch's position in World.patches, i.e., in World.patches_array.flat.
+        self.flat_index = row_col.row * gui.PATCH_COLS + row_col.col
         self.agents = None
-        self._neighbors_4 = None
-        self._neighbors_8 = None
-        self._neighbors_24 = None
+        # The Surface shared by the patches of this patch's color, and a Surface of this patch's own. The latter is
+        # created only if a model draws on the patch. See own_image().
+        self._color_image = color_surface(gui.PATCH_SIZE, tuple(Color(patch_color)))
+        self._own_image = None
 
     def __str__(self):
         class_name = get_class_name(self)
@@ -105,53 +153,309 @@ class Patch(Block):
         self.label = None
         self.set_color(self.base_color)
 
+    @property
+    def image(self) -> Surface:
+        """ The Surface drawn for this patch: its own, if it has one, or the one shared by patches of its color. """
+        return self._own_image if self._own_image is not None else self._color_image
+
+    @property
+    def label(self):
+        return self._label if self._label else None
+
+    @label.setter
+    def label(self, value):
+        # Keep track of the patches with labels. See World.draw().
+        if value:
+            World.labeled_patches.add(self)
+        else:
+            World.labeled_patches.discard(self)
+        self._label = value
+
     def neighbors_4(self):
-        if self._neighbors_4 is None:
-            cardinal_deltas = ((-1, 0), (1, 0), (0, -1), (0, 1))
-            self._neighbors_4 = self.neighbors(cardinal_deltas)
-        return self._neighbors_4
+        return self.neighbors(4)
 
     def neighbors_8(self):
-        if self._neighbors_8 is None:
-            eight_deltas = ((-1, 0), (1, 0), (0, -1), (0, 1), (-1, -1), (-1, 1), (1, -1), (1, 1))
-            self._neighbors_8 = self.neighbors(eight_deltas)
-        return self._neighbors_8
+        return self.neighbors(8)
 
     def neighbors_24(self):
-        if self._neighbors_24 is None:
-            twenty_four_deltas = ((-1, 0), (1, 0), (0, -1), (0, 1), (-1, -1), (-1, 1), (1, -1), (1, 1),
-                                  (-2, -2), (-1, -2), (0, -2), (1, -2), (2, -2),
-                                  (-2, -1), (2, -1),
-                                  (-2, 0), (2, 0),
-                                  (-2, 1), (2, 1),
-                                  (-2, 2), (-1, 2), (0, 2), (1, 2), (2, 2),
-                                  )
-            self._neighbors_24 = self.neighbors(twenty_four_deltas)
-        return self._neighbors_24
+        return self.neighbors(24)
 
     def neighbors(self, deltas):
         """
-        The neighbors of this patch determined by the deltas.
-        Note the addition of two RowCol objects to produce a new RowCol object: self.row_col + utils.RowCol(r, c).
-        Wrap around is handled by RowCol. We then use the RowCol object as a tuple to access the np.ndarray
+        The neighbors of this patch determined by the deltas: either a tuple of (row, col) offsets or one
+        of the keys of NEIGHBOR_DELTAS. Wrap around is built into the table from World.neighbor_table().
         """
-        # noinspection PyUnresolvedReferences
-        neighbors = [World.patches_array[(self.row_col + RowCol((r, c))).wrap().as_int()]
-                     for (r, c) in deltas]
+        neighbor_indices = World.neighbor_table(deltas)[self.flat_index].tolist()
+        neighbors = [World.patches[i] for i in neighbor_indices]
         return neighbors
 
+    def neighbors_in_radius(self, radius):
+        """ The patches whose centers are within radius patch-lengths of this one, nearest first. """
+        return self.neighbors(radius_deltas(radius))
+
+    def own_image(self) -> Surface:
+        """
+        A Surface for this patch alone, for a model that draws on it. It's created, filled with the patch's color,
+        the first time it's asked for. From then on the patch is drawn from it rather than from the shared Surface.
+        """
+        if self._own_image is None:
+            self._own_image = Surface(self.rect.size)
+            self._own_image.fill(self.color)
+            World.patches_with_images.add(self)
+        return self._own_image
+
     def remove_agent(self, agent):
         self.agents.remove(agent)
 
+    def set_color(self, color):
+        # If the World is tracking changes, note that this patch must be redrawn.
+        if World.dirty_patches is not None and color != self.color:
+            World.dirty_patches.add(self)
+        super().set_color(color)
+        rgba = tuple(Color(color))
+        self._color_image = color_surface(gui.PATCH_SIZE, rgba)
+        if self._own_image is not None:
+            self._own_image.fill(rgba)
+        World.patch_colors[self.flat_index] = rgba[:3]
+
+
+class PatchField:
+    """
+    A patch variable stored as a NumPy array with one element per patch, indexed [row, col].
+    Create one with World.patch_field(). Operations on the whole array (reads, writes, neighbor sums,
+    diffuse, evaporate, count) are vectorized. Each Patch also sees its own element as an attribute.
+    """
+
+    def __init__(self, name, dtype=float, initial_value=0):
+        self.name = name
+        self.initial_value = initial_value
+        self.values: np.ndarray = np.full((gui.PATCH_ROWS, gui.PATCH_COLS), initial_value, dtype=dtype)
+
+    def __getitem__(self, index):
+        return self.values[index]
+
+    def __setitem__(self, index, value):
+        self.values[index] = value
+
+    def count(self, value=None):
+        """ The number of patches whose value is value or, if value is None, is not 0/False. """
+        return int(np.count_nonzero(self.values if value is None else self.values == value))
+
+    def diffuse(self, rate, nbr_count=8, wrap=True):
+        """
+        As in NetLogo, each patch shares rate (between 0 and 1) of its value equally among its nbr_count
+        (4 or 8) neighbors and keeps the rest. Without wrap, shares for neighbors off the grid stay home.
+        The total over all patches is unchanged.
+        """
+        share = self.values * (rate / nbr_count)
+        received = PatchField.sum_of_neighbors(share, nbr_count, wrap)
+        nbrs = nbr_count if wrap else PatchField.sum_of_neighbors(np.ones(self.values.shape), nbr_count, wrap)
+        self.values[...] = self.values - share * nbrs + received
+
+    def evaporate(self, rate):
+        """ Reduce every patch's value by the fraction rate. """
+        self.values *= (1 - rate)
+
+    def neighbor_sum(self, nbr_count=8, wrap=True):
+        """ A new array in which each element is the sum of the values of that patch's neighbors. """
+        return PatchField.sum_of_neighbors(self.values, nbr_count, wrap)
+
+    def reset(self):
+        self.values.fill(self.initial_value)
+
+    @staticmethod
+    def sum_of_neighbors(values, nbr_count=8, wrap=True):
+        dtype = np.result_type(values.dtype, np.int64)
+        if wrap:
+            # Gather each patch's neighbors with the same index table Patch.neighbors() uses.
+            return values.ravel()[World.neighbor_table(nbr_count)].sum(axis=1, dtype=dtype).reshape(values.shape)
+        total = np.zeros(values.shape, dtype=dtype)
+        (rows, cols) = values.shape
+        padded = np.pad(values, 1)
+        for (r, c) in NEIGHBOR_DELTAS[nbr_count]:
+            total += padded[1+r:1+r+rows, 1+c:1+c+cols]
+        return total
+
+
+class LinkSet(set):
+    """
+    The type of World.links. Besides being a set of links, it keeps an index from each agent to the links that
+    include it. So finding an agent's links takes time proportional to the number of its links rather than to
+    the number of links in the world. It also maps each link's hash_object to the link, which makes finding
+    the link (if any) between two agents a single lookup. See core.link.link_exists(). All the ways of adding
+    links to and removing links from the set in place update both indices. (Operators that create a new set,
+    such as | and -, return plain sets.)
+    """
+
+    # The number of LinkSets created and links added to or removed from any LinkSet so far. Code that caches
+    # something computed from the links (e.g., a shortest path) can compare it to its value when the cache was filled.
+    changes = 0
+
+    def __init__(self, links=()):
+        super().__init__()
+        LinkSet.changes += 1
+        self.agent_links = {}
+        self.hashed_links = {}
+        # Objects to be told of each link added or removed. They have link_added(link) and link_removed(link)
+        # methods. This lets them keep something computed from the links up to date incrementally.
+        self.watchers = []
+        self.update(links)
+
+    def __iand__(self, links):
+        self.intersection_update(links)
+        return self
+
+    def __ior__(self, links):
+        self.update(links)
+        return self
+
+    def __isub__(self, links):
+        self.difference_update(links)
+        return self
+
+    def __ixor__(self, links):
+        self.symmetric_difference_update(links)
+        return self
+
+    def add(self, link):
+        if link not in self:
+            LinkSet.changes += 1
+            super().add(link)
+            self.hashed_links[link.hash_object] = link
+            for agent in (link.agent_1, link.agent_2):
+                self.agent_links.setdefault(agent, set()).add(link)
+            for watcher in self.watchers:
+                watcher.link_added(link)
+
+    def clear(self):
+        LinkSet.changes += 1
+        for watcher in self.watchers:
+            for link in self:
+                watcher.link_removed(link)
+        super().clear()
+        self.agent_links.clear()
+        self.hashed_links.clear()
+
+    def difference_update(self, *link_collections):
+        """ Remove links in bulk: the set is updated at once and then each removed link is unindexed. """
+        # The stored links, which may be different but equal Link objects.
+        removed = {}
+        for links in link_collections:
+            for link in links:
+                stored_link = self.hashed_links.get(link.hash_object)
+                if stored_link is not None:
+                    removed[link.hash_object] = stored_link
+        super().difference_update(removed.values())
+        for link in removed.values():
+            self.unindex(link)
+
+    def discard(self, link):
+        if link in self:
+            self.remove(link)
+
+    def intersection_update(self, *link_collections):
+        self.difference_update(set(self).difference(set(self).intersection(*link_collections)))
+
+    def link_with_hash_object(self, hash_obj):
+        """ The link whose hash_object is hash_obj, or None if there isn't one. """
+        return self.hashed_links.get(hash_obj)
+
+    def links_of(self, agent) -> set:
+        """ The links that include agent. """
+        return set(self.agent_links.get(agent, ()))
+
+    def pop(self):
+        link = super().pop()
+        self.unindex(link)
+        return link
+
+    def remove(self, link):
+        super().remove(link)
+        self.unindex(link)
+
+    def symmetric_difference_update(self, links):
+        for link in set(links):
+            if link in self:
+                self.remove(link)
+            else:
+                self.add(link)
+
+    def unindex(self, link):
+        LinkSet.changes += 1
+        del self.hashed_links[link.hash_object]
+        for agent in (link.agent_1, link.agent_2):
+            agent_links = self.agent_links[agent]
+            # The link in agent_links may be a different but equal Link object. discard() removes it anyway.
+            agent_links.discard(link)
+            if not agent_links:
+                del self.agent_links[agent]
+        for watcher in self.watchers:
+            watcher.link_removed(link)
+
+    def update(self, *link_collections):
+        """ Add links in bulk: the set and both indices are updated in one pass over the new links. """
+        # The links not already present, the first of any equal ones.
+        added = {}
+        for links in link_collections:
+            for link in links:
+                if link.hash_object not in self.hashed_links:
+                    added.setdefault(link.hash_object, link)
+        if not added:
+            return
+        LinkSet.changes += len(added)
+        super().update(added.values())
+        self.hashed_links.update(added)
+        agent_links = self.agent_links
+        for link in added.values():
+            agent_links.setdefault(link.agent_1, set()).add(link)
+            agent_links.setdefault(link.agent_2, set()).add(link)
+        for watcher in self.watchers:
+            for link in added.values():
+                watcher.link_added(link)
+
 
 class World:
 
     agents = None
     links = None
 
+    # The AgentSet that holds the state of the agents, if they are ArrayAgents. See core.agent_set.
+    agent_set = None
+
+    # Set draw_changes_only to True in a World subclass to have the engine redraw (after each step)
+    # only what changed rather than the whole screen. See draw_changes() below.
+    draw_changes_only = False
+
+    # What changed since the last time the world was drawn. None when changes are not being tracked.
+    # The dirty patches and agents must be redrawn. dirty_rects are screen areas to be repainted, e.g.,
+    # where a deleted agent had been.
+    dirty_agents = None
+    dirty_patches = None
+    dirty_rects = None
+
+    # Neighbor index tables, by NEIGHBOR_DELTAS key or tuple of deltas. See neighbor_table() below.
+    neighbor_tables = None
+
+    # The PatchFields, by name. See patch_field() below.
+    patch_fields = None
+
     patches = None
     patches_array: np.ndarray = None
 
+    # The patch layer. patch_colors holds the (r, g, b) color of each patch, in World.patches order.
+    # patch_grid is a Surface with one pixel per patch. patch_layer is patch_grid scaled up to screen size.
+    # gutters is a transparent Surface except for the lines between patches. See draw_patch_layer() below.
+    gutters: Surface = None
+    patch_colors: np.ndarray = None
+    patch_grid: Surface = None
+    patch_layer: Surface = None
+
+    # The patches with labels. Only these need their labels drawn.
+    labeled_patches = None
+
+    # The patches with their own Surfaces. See Patch.own_image(). These are drawn over the patch layer.
+    patches_with_images = None
+
     ticks = None
 
     world = None
@@ -160,6 +464,8 @@ class World:
 
         World.ticks = 0
         World.world = self
+        World.patch_fields = {}
+        self.reset_changes()
 
         self.patch_class = patch_class
         self.create_patches_array(patch_color=patch_color)
@@ -171,9 +477,12 @@ class World:
     @staticmethod
     def clear_all():
         World.agents = set()
-        World.links = set()
+        World.agent_set = None
+        World.links = LinkSet()
         for patch in World.patches:
             patch.clear()
+        for field in World.patch_fields.values():
+            field.reset()
 
     def create_agents(self, nbr_agents):
         for _ in range(nbr_agents):
@@ -198,6 +507,14 @@ class World:
         World.patches_array = np.array(patch_pseudo_array)
         # .flat is an iterator. Can't use it more than once.
         World.patches = list(World.patches_array.flat)
+        # The neighbor tables depend on the shape of the grid.
+        World.neighbor_tables = {}
+        World.patch_colors = np.array([Color(patch.color)[:3] for patch in World.patches], dtype=np.uint8)
+        World.patch_grid = Surface((gui.PATCH_COLS, gui.PATCH_ROWS))
+        World.patch_layer = Surface((gui.PATCH_COLS * gui.BLOCK_SPACING(), gui.PATCH_ROWS * gui.BLOCK_SPACING()))
+        World.gutters = World.make_gutters()
+        World.labeled_patches = set()
+        World.patches_with_images = set()
 
     def create_random_agent(self, color=None, shape_name='netlogo_figure', scale=1.4):
         """
@@ -225,19 +542,121 @@ class World:
         Draw the world by drawing the patches and agents. 
         Should check to see which really need to be re-drawn.
         """
-        for patch in World.patches:
-            patch.draw()
+        with timed(DRAW_PATCHES):
+            self.draw_all_patches()
 
-        for link in World.links:
-            link.draw()
+        with timed(DRAW_LINKS):
+            for link in World.links:
+                link.draw()
 
-        for agent in World.agents:
+        with timed(DRAW_AGENTS):
+            for agent in World.agents:
+                agent.draw()
+
+    def draw_changes(self):
+        """
+        Redraw only what changed since the world was last drawn: the dirty patches, the areas vacated by agents
+        that moved, turned, changed color, or were deleted, and the agents on or near any of those.
+        Returns the list of screen Rects that were redrawn, for pygame.display.update(), or None if the whole
+        world must be redrawn. That's the case when there are links, since a link may cross any part of the screen.
+        Labels are not tracked. A world that displays labels that change should not set draw_changes_only.
+        """
+        if World.links:
+            return None
+        # Clip to the screen: pygame fills a Rect that extends past the left edge as if it started at 0.
+        screen_rect = gui.SCREEN.get_rect()
+        vacated_rects = [rect.clip(screen_rect) for rect in World.dirty_rects +
+                         [agent.drawn_rect for agent in World.dirty_agents if agent.drawn_rect]]
+        for rect in vacated_rects:
+            gui.SCREEN.fill(Color(gui.SCREEN_COLOR), rect)
+        patches = World.dirty_patches.union(*[World.patches_in_rect(rect) for rect in vacated_rects])
+        changed_rects = vacated_rects + World.draw_patches(patches)
+
+        # Agents near a repainted patch may have been painted over. (An agent image may extend beyond its patch.)
+        margin = 4 * gui.BLOCK_SPACING()
+        nearby_agents = {agent for patch in patches
+                         for nearby_patch in World.patches_in_rect(patch.rect.inflate(margin, margin))
+                         for agent in nearby_patch.agents}
+        # Draw them in the same order as draw() does so that overlapping agents stack the same way.
+        agents_to_draw = World.dirty_agents | nearby_agents
+        for agent in [agent for agent in World.agents if agent in agents_to_draw]:
             agent.draw()
+            changed_rects.append(agent.drawn_rect)
+        return changed_rects
+
+    def draw_all_patches(self):
+        """ Unless the patch class draws itself in its own way, draw all the patches at once. """
+        if self.patch_class.draw is Patch.draw:
+            World.draw_patch_layer()
+            for patch in World.patches_with_images:
+                gui.blit(patch.image, patch.rect)
+            for patch in World.labeled_patches:
+                patch.draw_label()
+        else:
+            for patch in World.patches:
+                patch.draw()
+
+    def draw_patch_changes(self):
+        """ A draw_changes() for worlds that display only patches: redraw just the dirty patches. """
+        return World.draw_patches(World.dirty_patches)
+
+    @staticmethod
+    def draw_patch_layer():
+        """
+        Draw all the patches with a single blit. World.patch_colors, one pixel per patch, is copied into
+        World.patch_grid, which is scaled up by BLOCK_SPACING() into World.patch_layer. Blitted at (1, 1),
+        each patch's square then starts where the patch starts. Its last row and column fall on the gutters
+        between patches, which are then restored by blitting World.gutters over it.
+        """
+        surfarray.blit_array(World.patch_grid, World.patch_colors.reshape(gui.PATCH_ROWS, gui.PATCH_COLS, 3)
+                                                                  .transpose(1, 0, 2))
+        scale(World.patch_grid, World.patch_layer.get_size(), World.patch_layer)
+        gui.blit(World.patch_layer, (1, 1))
+        gui.blit(World.gutters, (0, 0))
+
+    @staticmethod
+    def draw_patches(patches):
+        """ Draw patches and return their Rects. """
+        for patch in patches:
+            patch.draw()
+        return [patch.rect for patch in patches]
 
     def final_thoughts(self):
         """ Add any final tests, data gathering, summarization, etc. here. """
         pass
 
+    @staticmethod
+    def object_size(obj) -> int:
+        """
+        Roughly the memory (in bytes) taken by obj: the object itself, its __dict__ if it has one, and the Rects,
+        pairs, and collections it refers to. Surfaces, Colors, and other objects that may be shared aren't counted.
+        """
+        slot_names = [name for cls in type(obj).__mro__ for name in getattr(cls, '__slots__', ())]
+        values = [getattr(obj, name, None) for name in slot_names if not name.startswith('__')]
+        size = getsizeof(obj)
+        if hasattr(obj, '__dict__'):
+            size += getsizeof(obj.__dict__)
+            values += obj.__dict__.values()
+        return size + sum(getsizeof(value) for value in values if isinstance(value, (Rect, tuple, set, list, dict)))
+
+    @staticmethod
+    def print_memory_report():
+        """
+        Print the number, size per object (in bytes), and total size of the patches, agents, and links by class,
+        and whether objects of the class have a __dict__ (i.e., aren't limited to their __slots__).
+        """
+        sizes = {}
+        has_dict = {}
+        for obj in chain(World.patches, World.agents, World.links):
+            class_name = get_class_name(obj)
+            sizes.setdefault(class_name, []).append(World.object_size(obj))
+            has_dict[class_name] = hasattr(obj, '__dict__')
+        print('\nMemory (bytes)')
+        print(f'{"class":>24} {"count":>9} {"each":>7} {"total":>12} {"__dict__":>9}')
+        for (class_name, class_sizes) in sizes.items():
+            print(f'{class_name:>24} {len(class_sizes):9} {round(mean(class_sizes)):7} {sum(class_sizes):12} '
+                  f'{"yes" if has_dict[class_name] else "no":>9}')
+
     @staticmethod
     def print_lru_results():
         """ Print how well the @lru caches worked. """
@@ -248,13 +667,123 @@ class World:
     def handle_event(self, _event):
         pass
 
+    @staticmethod
+    def link_set() -> LinkSet:
+        """ World.links, which is made a LinkSet again if a model has replaced it with a plain set. """
+        if not isinstance(World.links, LinkSet):
+            World.links = LinkSet(World.links)
+        return World.links
+
+    @staticmethod
+    def index_range(first, last, limit, wrap):
+        """
+        The row (or col) indices first .. last (inclusive), either wrapped into range(limit) or clipped to it.
+        Never includes an index twice.
+        """
+        if not wrap:
+            return range(max(0, first), min(limit, last + 1))
+        if last - first + 1 >= limit:
+            return range(limit)
+        return [i % limit for i in range(first, last + 1)]
+
+    @staticmethod
+    def agent_changed(agent):
+        """ If the World is tracking changes, note that agent must be redrawn. """
+        if World.dirty_agents is not None:
+            World.dirty_agents.add(agent)
+
     @staticmethod
     def increment_ticks():
         World.ticks += 1
+        # Distances may wrap differently if Bounce? was changed.
+        Topology.refresh()
 
     def mouse_click(self, xy):
         pass
 
+    @staticmethod
+    def make_gutters() -> Surface:
+        """ A screen-size Surface that is transparent except for the 1-pixel gutters between patches. """
+        (width, height) = (gui.SCREEN_PIXEL_WIDTH(), gui.SCREEN_PIXEL_HEIGHT())
+        gutter_color = Color(gui.SCREEN_COLOR)
+        # Any color other than the gutter color will do as the transparent color.
+        transparent_color = Color(255 - gutter_color.r, 255 - gutter_color.g, 255 - gutter_color.b)
+        gutters = Surface((width, height))
+        gutters.fill(transparent_color)
+        gutters.set_colorkey(transparent_color)
+        for x in range(0, width, gui.BLOCK_SPACING()):
+            gutters.fill(gutter_color, Rect(x, 0, 1, height))
+        for y in range(0, height, gui.BLOCK_SPACING()):
+            gutters.fill(gutter_color, Rect(0, y, width, 1))
+        return gutters
+
+    @staticmethod
+    def neighbor_table(deltas) -> np.ndarray:
+        """
+        An int array with one row for each patch. Row i holds the indices in World.patches of the neighbors of
+        World.patches[i] as determined by deltas (a key of NEIGHBOR_DELTAS or a tuple of (row, col) offsets),
+        wrapping around the edges of the grid. Built once for each set of deltas and then reused, both by
+        Patch.neighbors() and by vectorized operations such as PatchField.neighbor_sum().
+        """
+        if isinstance(deltas, list):
+            deltas = tuple(tuple(delta) for delta in deltas)
+        if deltas not in World.neighbor_tables:
+            offsets = np.array(NEIGHBOR_DELTAS.get(deltas, deltas)).reshape(-1, 2)
+            (rows, cols) = np.divmod(np.arange(gui.PATCH_ROWS * gui.PATCH_COLS), gui.PATCH_COLS)
+            neighbor_rows = (rows[:, np.newaxis] + offsets[:, 0]) % gui.PATCH_ROWS
+            neighbor_cols = (cols[:, np.newaxis] + offsets[:, 1]) % gui.PATCH_COLS
+            World.neighbor_tables[deltas] = neighbor_rows * gui.PATCH_COLS + neighbor_cols
+        return World.neighbor_tables[deltas]
+
+    @staticmethod
+    def patches_in_radius(xy: Pixel_xy, distance, wrap=False):
+        """
+        The patches that may contain agents within distance of pixel xy: the patches that overlap the
+        square around xy of side 2*distance, plus a margin of one patch. Since each Patch keeps the set of
+        agents on it, this makes the grid of patches a spatial index for in-radius queries.
+        """
+        spacing = gui.BLOCK_SPACING()
+        rows = World.index_range(int((xy.y - distance) // spacing) - 1, int((xy.y + distance) // spacing) + 1,
+                                 gui.PATCH_ROWS, wrap)
+        cols = World.index_range(int((xy.x - distance) // spacing) - 1, int((xy.x + distance) // spacing) + 1,
+                                 gui.PATCH_COLS, wrap)
+        return [World.patches_array[row, col] for row in rows for col in cols]
+
+    @staticmethod
+    def patches_in_rect(rect: Rect):
+        """ The patches that overlap rect, including the gutters between them. """
+        spacing = gui.BLOCK_SPACING()
+        rows = range(max(0, rect.top // spacing), min(gui.PATCH_ROWS, (rect.bottom - 1) // spacing + 1))
+        cols = range(max(0, rect.left // spacing), min(gui.PATCH_COLS, (rect.right - 1) // spacing + 1))
+        return {World.patches_array[row, col] for row in rows for col in cols}
+
+    def patch_field(self, name, dtype=float, initial_value=0) -> PatchField:
+        """
+        Declare a patch variable, name, stored in a PatchField. (Calling it again returns the existing field.)
+        The field is reset to initial_value by clear_all().
+        The patch class gets a property of the same name, so patch.<name> reads and writes the patch's
+        element of the field. The object view and the array are thus always in sync. The property looks the
+        field up in World.patch_fields on each use, so it follows the current World, whose grid may differ
+        in size from that of an earlier World with the same patch class. If the current World hasn't declared
+        the field, using the property raises AttributeError.
+        """
+        if name not in World.patch_fields:
+            World.patch_fields[name] = PatchField(name, dtype=dtype, initial_value=initial_value)
+
+            def current_field():
+                if name not in World.patch_fields:
+                    raise AttributeError(f'This World has no patch variable {name}. See World.patch_field().')
+                return World.patch_fields[name]
+
+            def get_value(patch):
+                return current_field().values[patch.row_col]
+
+            def set_value(patch, value):
+                current_field().values[patch.row_col] = value
+
+            setattr(self.patch_class, name, property(get_value, set_value))
+        return World.patch_fields[name]
+
     def pixel_tuple_to_patch(self, xy: Tuple[int, int]):
         """
         Get the patch RowCol for this pixel
@@ -275,9 +804,15 @@ class World:
         self.clear_all()
         self.reset_ticks()
 
+    def reset_changes(self):
+        """ Start a new set of changes. Called after the world is drawn. """
+        (World.dirty_agents, World.dirty_patches, World.dirty_rects) = \
+            (set(), set(), []) if self.draw_changes_only else (None, None, None)
+
     @staticmethod
     def reset_ticks():
         World.ticks = 0
+        Topology.refresh()
 
     def setup(self):
         """
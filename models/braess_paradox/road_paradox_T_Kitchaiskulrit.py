@@ -402,7 +402,7 @@ class BraessParadoxWorld(World):
     def setup(self):
         self.init_glob_vari()
         self.setup_road()
-        Agent.id = 0
+        Agent.next_id = 0
         SimEngine.gui_set('ticks', value=World.ticks)
         print(BraessParadoxWorld.spawn_time)
 
@@ -7,10 +7,10 @@ from pygame import Color
 
 from core.agent import Agent
 from core.ga import GA_World
-from core.link import Link, hash_object
+from core.link import Link, create_links, hash_object
 from core.pairs import Velocity
 from core.sim_engine import gui_get
-from core.world_patch_block import World
+from core.world_patch_block import LinkSet, World
 
 from models.ga_and_aco_examples.ga_tsp import order_elements
 
@@ -119,10 +119,11 @@ class ACO_World(GA_World):
         for city in self.cities:
             city.set_velocity(ACO_World.random_velocity())
 
-        # To create the links, make cities indexible.
+        # To create the links, make cities indexible. Create all the links at once.
         cities = list(self.cities)
-        World.links = set(ACO_Link(cities[i], cities[j]) for i in range(len(cities)-1)
-                                                         for j in range(i+1, len(cities)))
+        index_pairs = [(i, j) for i in range(len(cities)-1) for j in range(i+1, len(cities))]
+        World.links = LinkSet()
+        create_links([cities[i] for (i, _) in index_pairs], [cities[j] for (_, j) in index_pairs], link_class=ACO_Link)
 
     def generate_a_tour(self, best=False) -> List[ACO_Link]:
         """
@@ -141,8 +142,10 @@ class ACO_World(GA_World):
 
         tour = []
         while unvisited_cities:
-            link_weight_pairs = [(lnk, (lnk.pheromone_level**alpha)/(max(1, lnk.length)**beta)) for lnk in World.links
-                                 if lnk.includes(current_city) and lnk.other_side(current_city) in unvisited_cities]
+            # World.links indexes the links of each city.
+            link_weight_pairs = [(lnk, (lnk.pheromone_level**alpha)/(max(1, lnk.length)**beta))
+                                 for lnk in World.link_set().links_of(current_city)
+                                 if lnk.other_side(current_city) in unvisited_cities]
             if best:
                 # Get the best pair
                 best_link_weight_pair = max(link_weight_pairs, key=lambda lnk_wt: lnk_wt[1])
@@ -165,7 +168,7 @@ class ACO_World(GA_World):
         # The final link links the final city to the start city.
         # DON'T create a new link. One already exists. Find it.
         # For undirected links (Like the ones we use) hash_object is a frozen set of the two link ends.
-        final_link = [lnk for lnk in World.links if lnk.hash_object == hash_object(current_city, start_city)][0]
+        final_link = World.link_set().link_with_hash_object(hash_object(current_city, start_city))
         tour.append(final_link)
 
         tour_length = round(self.total_dist(tour))
@@ -240,7 +243,7 @@ class ACO_World(GA_World):
         return Velocity((uniform(-limit/100, limit/100), uniform(-limit/100, limit/100)))
 
     def setup(self):
-        Agent.id = 0
+        Agent.next_id = 0
         self.gen_cities_and_links()
         average_link_length = self.total_dist(World.links) / len(World.links)
         self.best_tour_length = round( len(self.cities) * average_link_length )
@@ -100,7 +100,7 @@ class TSP_Chromosome(Chromosome):
         Currently written to call random_path. You should replace that with a minimal
         spanning tree algorithm.
         """
-        chromosome_list: List = sample(GA_World.gene_pool, len(GA_World.gene_pool))
+        chromosome_list: List = sample(list(GA_World.gene_pool), len(GA_World.gene_pool))
         return chromosome_list
 
     @staticmethod
@@ -349,7 +349,7 @@ class TSP_World(GA_World):
         self.done = False
 
     def setup(self):
-        Agent.id = 1
+        Agent.next_id = 1
         GA_World.individual_class = TSP_Individual
         GA_World.chromosome_class = TSP_Chromosome.factory
 
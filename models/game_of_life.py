@@ -23,6 +23,9 @@ class Life_Patch(OnOffPatch):
 
 class Life_World(OnOffWorld):
 
+    # Only the patches that are born or die each generation are redrawn.
+    draw_changes_only = True
+
     def setup(self):
         super().setup()
         density = gui_get('density')
@@ -1,15 +1,42 @@
-from random import randint
+from random import choice, random, randrange
 
-from core.graph_framework import (CLUSTER_COEFF, Graph_Node, Graph_World, LINK_PROB, PATH_LENGTH, RANDOM, RING,
-                                  WHEEL, graph_left_upper, graph_right_upper)
+import numpy as np
+
+from core.graph_framework import (CLUSTER_COEFF, Graph_Node, Graph_World, LINK_PROB, PATH_LENGTH, PREF_ATTACHMENT,
+                                  RANDOM, RING, SMALL_WORLD, WHEEL, graph_left_upper, graph_right_upper)
 from core.gui import STAR
-from core.link import Link
+from core.link import Link, create_links
 from core.pairs import center_pixel
 from core.sim_engine import gui_get, gui_set
 
 
 class Graph_Algorithms_World(Graph_World):
 
+    # The number of links each new node makes in a preferential attachment graph
+    # and the number of neighbors on each side each node starts with in a small world graph.
+    pref_attachment_links = 1
+    small_world_neighbors = 2
+
+    @staticmethod
+    def barabasi_albert_pairs(nbr_nodes, links_per_node=1):
+        """
+        The (i, j) index pairs of the links of a preferential attachment (Barabasi-Albert) graph. Each node after
+        the first links_per_node + 1 links to links_per_node earlier nodes chosen with probabilities proportional
+        to their degrees. Those are found by sampling a list that contains each node once for each of its links.
+        """
+        first_nodes = min(nbr_nodes, links_per_node + 1)
+        # Start with the first nodes all linked to each other.
+        pairs = [(i, j) for i in range(first_nodes - 1) for j in range(i + 1, first_nodes)]
+        degree_weighted_nodes = [node for pair in pairs for node in pair]
+        for node in range(first_nodes, nbr_nodes):
+            targets = set()
+            while len(targets) < links_per_node:
+                targets.add(choice(degree_weighted_nodes))
+            for target in targets:
+                pairs.append((target, node))
+                degree_weighted_nodes += [target, node]
+        return pairs
+
     @staticmethod
     def build_ring_star_or_wheel_graph(graph_type, ring_node_list):
         # Create a center_node variable if a STAR and WHEEL graph.
@@ -47,9 +74,32 @@ class Graph_Algorithms_World(Graph_World):
     #
     def compute_metrics(self):
         cluster_coefficient = self.clustering_coefficient()
-        gui_set(CLUSTER_COEFF, value=cluster_coefficient)
+        # An undefined metric (None) is shown as a blank.
+        gui_set(CLUSTER_COEFF, value='' if cluster_coefficient is None else str(cluster_coefficient))
         avg_path_length = self.average_path_length()
-        gui_set(PATH_LENGTH, value=avg_path_length)
+        gui_set(PATH_LENGTH, value='' if avg_path_length is None else str(avg_path_length))
+
+    @staticmethod
+    def erdos_renyi_pairs(nbr_nodes, link_prob):
+        """
+        The (i, j), i < j, index pairs of the links of a random (Erdos-Renyi) graph in which each pair of nodes
+        is linked with probability link_prob. Rather than trying every pair, skip from one linked pair to the next
+        (in the order (0, 1), (0, 2), ..., (1, 2), ...) by geometrically distributed gaps. Takes O(links) time.
+        """
+        nbr_pairs = nbr_nodes * (nbr_nodes - 1) // 2
+        if link_prob <= 0 or nbr_pairs == 0:
+            return np.zeros((0, 2), dtype=np.int64)
+        # Draw somewhat more gaps than the expected number of links, and more if that's not enough.
+        gaps = np.random.geometric(link_prob, int(nbr_pairs * link_prob + 5 * np.sqrt(nbr_pairs) + 10))
+        while gaps.sum() < nbr_pairs:
+            gaps = np.concatenate([gaps, np.random.geometric(link_prob, len(gaps))])
+        positions = np.cumsum(gaps) - 1
+        positions = positions[positions < nbr_pairs]
+        # Invert position = i*(2*nbr_nodes - i - 1)/2 + (j - i - 1) to get (i, j).
+        n = nbr_nodes
+        i = n - 2 - np.floor(np.sqrt(-8 * positions + 4 * n * (n - 1) - 7) / 2 - 0.5).astype(np.int64)
+        j = positions + i + 1 - n * (n - 1) // 2 + (n - i) * (n - i - 1) // 2
+        return np.column_stack([i, j])
 
     @staticmethod
     def link_nodes_for_graph(graph_type, nbr_nodes, ring_node_list):
@@ -69,22 +119,49 @@ class Graph_Algorithms_World(Graph_World):
 
         Overrides this function in network_framework.
         """
-        # Treat random graphs as a separate case.
+        # The generators produce pairs of indices into ring_node_list. The links are created all at once.
         if graph_type == RANDOM:
-            link_prob = gui_get(LINK_PROB)
-            # A generator for the links
-            link_generator = (Link(ring_node_list[i], ring_node_list[j]) for i in range(nbr_nodes - 1)
-                                                                         for j in range(i + 1, nbr_nodes)
-                                                                         if randint(1, 100) <= link_prob)
-            # Run the generator to generate the links
-            for _ in link_generator:
-                pass
-            return
-
-        if graph_type in [RING, STAR, WHEEL]:
+            pairs = Graph_Algorithms_World.erdos_renyi_pairs(nbr_nodes, gui_get(LINK_PROB) / 100)
+        elif graph_type == PREF_ATTACHMENT:
+            pairs = Graph_Algorithms_World.barabasi_albert_pairs(nbr_nodes,
+                                                                 Graph_Algorithms_World.pref_attachment_links)
+        elif graph_type == SMALL_WORLD:
+            pairs = Graph_Algorithms_World.watts_strogatz_pairs(nbr_nodes, Graph_Algorithms_World.small_world_neighbors,
+                                                                gui_get(LINK_PROB) / 100)
+        else:
             Graph_Algorithms_World.build_ring_star_or_wheel_graph(graph_type, ring_node_list)
+            return
+        nodes = np.array(ring_node_list, dtype=object)
+        pairs = np.array(pairs, dtype=np.int64).reshape(-1, 2)
+        create_links(nodes[pairs[:, 0]], nodes[pairs[:, 1]])
 
-        # Preferential attachment and small worlds are TBD.
+    @staticmethod
+    def watts_strogatz_pairs(nbr_nodes, neighbors, rewire_prob):
+        """
+        The (i, j) index pairs of the links of a small world (Watts-Strogatz) graph. Start with a ring in which
+        each node is linked to the neighbors nearest nodes on each side. Then, with probability rewire_prob,
+        replace the far end of each link with a random node it isn't yet linked to.
+        """
+        neighbors = min(neighbors, (nbr_nodes - 1) // 2)
+        ring_pairs = [(i, (i + k) % nbr_nodes) for k in range(1, neighbors + 1) for i in range(nbr_nodes)]
+        linked_nodes = {i: set() for i in range(nbr_nodes)}
+        for (i, j) in ring_pairs:
+            linked_nodes[i].add(j)
+            linked_nodes[j].add(i)
+        pairs = []
+        for (i, j) in ring_pairs:
+            # A node already linked to every other node can't be rewired.
+            if random() < rewire_prob and len(linked_nodes[i]) < nbr_nodes - 1:
+                new_j = randrange(nbr_nodes)
+                while new_j == i or new_j in linked_nodes[i]:
+                    new_j = randrange(nbr_nodes)
+                linked_nodes[i].discard(j)
+                linked_nodes[j].discard(i)
+                linked_nodes[i].add(new_j)
+                linked_nodes[new_j].add(i)
+                j = new_j
+            pairs.append((i, j))
+        return pairs
 
 
 if __name__ == '__main__':
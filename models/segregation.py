@@ -8,6 +8,34 @@ from core.sim_engine import gui_get
 from core.world_patch_block import Patch, World
 
 
+class Empty_Patches:
+    """
+    The empty patches, kept in a list so that they can be sampled directly, and a dictionary of their positions
+    in the list so that one can be replaced by another in constant time. The order depends only on the order
+    of the operations, so a seeded run can be repeated.
+    """
+
+    def __init__(self):
+        self.patches = []
+        self.positions = {}
+
+    def __len__(self):
+        return len(self.patches)
+
+    def add(self, patch):
+        self.positions[patch] = len(self.patches)
+        self.patches.append(patch)
+
+    def replace(self, patch, new_patch):
+        """ Put new_patch where patch was. patch is no longer empty, and new_patch is. """
+        position = self.positions.pop(patch)
+        self.patches[position] = new_patch
+        self.positions[new_patch] = position
+
+    def sample(self, k):
+        return sample(self.patches, k)
+
+
 class Segregation_Agent(Agent):
 
     pct_similar_wanted = None
@@ -17,7 +45,7 @@ class Segregation_Agent(Agent):
         self.is_happy = None
         self.pct_similar = None
 
-    def find_new_spot(self, empty_patches):
+    def find_new_spot(self, empty_patches: Empty_Patches):
         """
         If this agent is happy, do nothing.
         If it's unhappy move it to an empty patch where it is happy if one can be found.
@@ -32,19 +60,20 @@ class Segregation_Agent(Agent):
         # Find one of the best available patches. The sample size of 25 is arbitrary.
         # It seems like a reasonable compromize between speed and number of steps.
         nbr_of_patches_to_sample = min(25, len(empty_patches))
-        best_patch = max(sample(empty_patches, nbr_of_patches_to_sample),
+        best_patch = max(empty_patches.sample(nbr_of_patches_to_sample),
                          key=lambda patch: self.pct_similarity_satisfied_here(patch))
-        empty_patches.remove(best_patch)
-        empty_patches.add(current_patch)
+        empty_patches.replace(best_patch, current_patch)
         self.move_to_patch(best_patch)
 
     def pct_similar_here(self, patch) -> int:
         """
-        Returns an integer between 0 and 100 for the percent similar to neighbors.
+        Returns an integer between 0 and 100 for the percent similar to neighbors if this agent were on patch.
         Returns 100 if no neighbors,
+        The agent isn't moved there to find out. That would recolor (and mark for redrawing) the patches it
+        tries out, even though only its final spot changes what's displayed.
         """
-        self.move_to_patch(patch)
-        agents_nearby_list = [agent for patch in self.current_patch().neighbors_8() for agent in patch.agents]
+        agents_nearby_list = [agent for nbr_patch in patch.neighbors_8() for agent in nbr_patch.agents
+                              if agent is not self]
         total_nearby_count = len(agents_nearby_list)
         similar_nearby_count = len([agent for agent in agents_nearby_list if agent.color == self.color])
         # Isolated agents, i.e., with no neighbors, are considered
@@ -71,16 +100,15 @@ class Segregation_Agent(Agent):
 
 
 class Segregation_Patch(Patch):
+    """ A patch takes on the color of the agent on it. That way only the patches need to be drawn. """
+
+    def add_agent(self, agent):
+        super().add_agent(agent)
+        self.set_color(agent.color)
 
-    def draw(self, shape_name=None):
-        if self.agents:
-            # self.agents is a set. This is the only way to access its member: pop it and add it back.
-            agent = self.agents.pop()
-            self.agents.add(agent)
-            self.set_color(agent.color)
-        else:
-            self.set_color(self.base_color)
-        super().draw(shape_name)
+    def remove_agent(self, agent):
+        super().remove_agent(agent)
+        self.set_color(next(iter(self.agents)).color if self.agents else self.base_color)
 
 
 class Segregation_World(World):
@@ -88,6 +116,10 @@ class Segregation_World(World):
       percent-similar: on the average, what percent of a agent's neighbors are the same color as that agent?
       percent-unhappy: what percent of the agents are unhappy?
     """
+
+    # Only a few patches change color each step. Redraw just those.
+    draw_changes_only = True
+
     def __init__(self, patch_class=Patch, agent_class=Segregation_Agent):
         super().__init__(patch_class=patch_class, agent_class=agent_class, patch_color=Color('white'))
 
@@ -105,10 +137,11 @@ class Segregation_World(World):
     def draw(self):
         """
         Draw the world by drawing just the patches.
-        Should check to see which really need to be re-drawn.
         """
-        for patch in World.patches:
-            patch.draw()
+        self.draw_all_patches()
+
+    def draw_changes(self):
+        return self.draw_patch_changes()
 
     def final_thoughts(self):
         print(f'\n\t Again, the colors: {self.colors_string()}')
@@ -150,11 +183,9 @@ class Segregation_World(World):
         self.color_items = self.select_the_colors()
         (color_a, color_b) = [color_item[1] for color_item in self.color_items]
         print(f'\n\t The colors: {self.colors_string()}')
-        self.empty_patches = set()
+        self.empty_patches = Empty_Patches()
         self.max_agents_per_step = gui_get('max_agents_per_step')
         for patch in self.patches:
-            patch.neighbors_8()
-
             # Create an Agent for this Patch. The density is approximate.
             if randint(0, 100) <= density:
                 agent = Segregation_Agent(color=choice([color_a, color_b]))
@@ -183,13 +214,20 @@ class Segregation_World(World):
             print()
         print(f'\t{World.ticks:2}. agents: {len(World.agents)};  %-similar: {percent_similar}%;  ', end='')
 
-        self.unhappy_agents = [agent for agent in World.agents if not agent.is_happy]
+        # In order of creation, so that step() samples from them reproducibly.
+        self.unhappy_agents = sorted((agent for agent in World.agents if not agent.is_happy),
+                                     key=lambda agent: agent.id)
         unhappy_count = len(self.unhappy_agents)
         percent_unhappy = round(100 * unhappy_count / len(World.agents), 2)
         print(f'nbr-unhappy: {unhappy_count:3};  %-unhappy: {percent_unhappy}.')
         self.done = unhappy_count == 0
 
 
+def nbr_unhappy(world):
+    """ A reporter for core.experiment.run_experiment. """
+    return len(world.unhappy_agents)
+
+
 # ############################################## Define GUI ############################################## #
 import PySimpleGUI as sg
 print(sg)
@@ -0,0 +1,15 @@
+"""
+Run the segregation model headless for a grid of densities and similarity thresholds, five times each,
+and print the number of unhappy agents at the end of each run. See core.experiment.
+"""
+
+from core.experiment import run_experiment
+from models.segregation import Segregation_Patch, Segregation_World, gui_left_upper, nbr_unhappy
+
+
+if __name__ == "__main__":
+    results = run_experiment(Segregation_World, {'density': [70, 80, 90], '% similar wanted': [30, 50, 70]},
+                             reporters={'unhappy': nbr_unhappy}, replicates=5,
+                             gui_left_upper=gui_left_upper, patch_class=Segregation_Patch, max_ticks=500)
+    for result_row in results:
+        print(result_row)
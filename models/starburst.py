@@ -2,7 +2,7 @@ from itertools import cycle
 
 from core.agent import Agent, PyLogo
 from core.gui import BLOCK_SPACING
-from core.pairs import REP_COEFF, REP_EXPONENT, Velocity, force_as_dxdy
+from core.pairs import REP_COEFF, REP_EXPONENT, Velocity, force_as_dxdy, repulsive_forces
 from core.sim_engine import gui_get
 from core.utils import normalize_dxdy
 from core.world_patch_block import World
@@ -10,15 +10,19 @@ from core.world_patch_block import World
 
 class Starburst_Agent(Agent):
 
-    def update_velocity(self):
+    def update_velocity(self, force=None):
+        """ force, if given, is the (precomputed) sum of the forces from the agents in the influence radius. """
         velocity = self.velocity
-        influence_radius = gui_get('Influence radius')
-        neighbors = self.agents_in_radius(influence_radius * BLOCK_SPACING())
-        for neighbor in neighbors:
-            force = Agent.forces_cache.get((neighbor, self), None)
-            if force is None:
-                force = force_as_dxdy(self.center_pixel, neighbor.center_pixel)
-                Agent.forces_cache[(neighbor, self)] = force * (-1)
+        if force is None:
+            influence_radius = gui_get('Influence radius')
+            neighbors = self.agents_in_radius(influence_radius * BLOCK_SPACING())
+            for neighbor in neighbors:
+                force = Agent.forces_cache.get((neighbor, self), None)
+                if force is None:
+                    force = force_as_dxdy(self.center_pixel, neighbor.center_pixel)
+                    Agent.forces_cache[(neighbor, self)] = force * (-1)
+                velocity = velocity + force
+        else:
             velocity = velocity + force
         speed_factor = gui_get('Speed factor')
         self.set_velocity(normalize_dxdy(velocity, 1.5*speed_factor/100))
@@ -38,7 +42,12 @@ class Starburst_World(World):
     def step(self):
         burst_tick = gui_get('Burst tick')
         if World.ticks >= burst_tick:
-            Agent.update_agent_velocities()
+            # Compute the forces among all the agents at once. See pairs.repulsive_forces().
+            agents = list(World.agents)
+            radius = gui_get('Influence radius') * BLOCK_SPACING()
+            forces = repulsive_forces([agent.center_pixel for agent in agents], radius=radius)
+            for (agent, force) in zip(agents, forces):
+                agent.update_velocity(Velocity(force))
 
         Agent.update_agent_positions()
 
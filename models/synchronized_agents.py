@@ -2,12 +2,23 @@
 from math import pi
 from random import choice, randint
 
+from core.agent import Agent
 from core.gui import KNOWN_FIGURES
 from core.pairs import center_pixel
 from core.sim_engine import gui_get
 from core.world_patch_block import World
 
 
+class Synchronized_Agent(Agent):
+
+    __slots__ = ('cached_heading',)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # The agent's heading from one step to the next when moving twitchily.
+        self.cached_heading = None
+
+
 class Synchronized_World(World):
 
     def __init__(self, *args, **kwargs):
@@ -127,4 +138,4 @@ gui_left_upper = [
 
 if __name__ == "__main__":
     from core.agent import PyLogo
-    PyLogo(Synchronized_World, 'Synchronized agents', gui_left_upper)
+    PyLogo(Synchronized_World, 'Synchronized agents', gui_left_upper, agent_class=Synchronized_Agent)
@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+
+from core.agent import PyLogo_headless
+from core.graph_framework import Graph_Node, Graph_World, graph_left_upper, graph_right_upper
+from core.link import Link
+from core.pairs import Pixel_xy
+from core.world_patch_block import World
+
+
+@pytest.fixture
+def graph():
+    """
+    A Graph_World whose only nodes and links are these. a, b, c, d, and e are connected. f and g are linked to
+    each other but not to the others. The links' lengths are a-b 30, b-c 40, a-c 50, c-d 70, d-e 60, f-g 30.
+
+        a - b      f - g
+         \\  |
+           c - d
+               |
+               e
+    """
+    world = PyLogo_headless(Graph_World, graph_left_upper, gui_right_upper=graph_right_upper,
+                            agent_class=Graph_Node, bounce=True, max_ticks=0)
+    for node in list(World.agents):
+        node.delete()
+    xys = [(100, 100), (130, 100), (130, 140), (200, 140), (200, 200), (300, 300), (330, 300)]
+    nodes = [Graph_Node(center_pixel=Pixel_xy(xy)) for xy in xys]
+    links = [Link(nodes[i], nodes[j]) for (i, j) in [(0, 1), (1, 2), (0, 2), (2, 3), (3, 4), (5, 6)]]
+    return (world, nodes, links)
+
+
+def test_bfs_and_path_links(graph):
+    (world, nodes, links) = graph
+    adjacency = world.adjacency()
+    assert adjacency.nodes == nodes
+    (distances, parent_links) = adjacency.bfs(0)
+    assert distances.tolist() == [0, 1, 1, 2, 3, -1, -1]
+    # Link ids are indices into adjacency.links.
+    assert [adjacency.links[i] if i >= 0 else None for i in parent_links] == \
+           [None, links[0], links[2], links[3], links[4], None, None]
+    assert adjacency.path_links(parent_links, 0, 4) == [links[2], links[3], links[4]]
+    assert adjacency.path_links(parent_links, 0, 0) == []
+    assert adjacency.path_links(parent_links, 0, 5) is None
+
+    assert adjacency.bfs_distances([0, 4, 6]).tolist() == [[0, 1, 1, 2, 3, -1, -1],
+                                                           [3, 3, 2, 1, 0, -1, -1],
+                                                           [-1, -1, -1, -1, -1, 1, 0]]
+
+
+def test_dijkstra(graph):
+    (world, _nodes, links) = graph
+    adjacency = world.adjacency()
+    (distances, parent_links) = adjacency.dijkstra(0)
+    assert np.allclose(distances, [0, 30, 50, 120, 180, np.inf, np.inf])
+    assert adjacency.path_links(parent_links, 0, 4) == [links[2], links[3], links[4]]
+
+    # Make a-c heavier than a-b and b-c together.
+    weights = [5 if lnk is links[2] else 1 for lnk in adjacency.links]
+    (distances, parent_links) = adjacency.dijkstra(0, weights=weights)
+    assert distances.tolist() == [0, 1, 2, 3, 4, np.inf, np.inf]
+    assert adjacency.path_links(parent_links, 0, 2) == [links[0], links[1]]
+    assert adjacency.path_links(parent_links, 0, 6) is None
+
+
+def test_components_and_degrees(graph):
+    (world, _nodes, _links) = graph
+    adjacency = world.adjacency()
+    assert adjacency.connected_components().tolist() == [0, 0, 0, 0, 0, 1, 1]
+    assert adjacency.degrees().tolist() == [2, 2, 3, 2, 1, 1, 1]
+    assert adjacency.degree_distribution().tolist() == [0, 3, 3, 1]
+
+
+def test_shortest_path_and_average_path_length(graph):
+    (world, nodes, links) = graph
+    # The search starts from whichever node has fewer links, so the path may run either way.
+    a_to_e = [links[2], links[3], links[4]]
+    for selected_nodes in [[nodes[0], nodes[4]], [nodes[4], nodes[0]]]:
+        world.selected_nodes = selected_nodes
+        assert world.shortest_path() in (a_to_e, a_to_e[::-1])
+    world.selected_nodes = [nodes[1], nodes[5]]
+    assert world.shortest_path() is None
+
+    # From a, b, c, d, e to the other four: 7 + 7 + 5 + 6 + 9 links on 20 paths. f to g and g to f: 2 on 2.
+    assert world.average_path_length() == round(36 / 22, 3)
@@ -0,0 +1,17 @@
+import pytest
+
+from core.agent import Agent, PyLogo_headless
+from core.world_patch_block import World
+
+
+def test_agents_have_no_dict(capsys):
+    PyLogo_headless(max_ticks=0)
+    (agent_1, agent_2) = (Agent(), Agent())
+    assert not hasattr(agent_1, '__dict__')
+    assert agent_2.id == agent_1.id + 1 == Agent.next_id - 1
+    with pytest.raises(AttributeError):
+        agent_1.undeclared_attribute = 1
+
+    World.print_memory_report()
+    agent_row = next(line for line in capsys.readouterr().out.splitlines() if line.split()[:1] == ['Agent'])
+    assert agent_row.split()[-1] == 'no'
@@ -0,0 +1,82 @@
+import numpy as np
+import pytest
+
+import core.gui as gui
+from core.agent import Agent, PyLogo_headless
+from core.agent_set import ArrayAgent
+from core.pairs import Pixel_xy, Velocity
+from core.world_patch_block import World
+
+
+def agent_pairs(n, seed=5):
+    """ n Agents and n ArrayAgents, each ArrayAgent at the same place and with the same heading as its Agent. """
+    rng = np.random.default_rng(seed)
+    (width, height) = (gui.SCREEN_PIXEL_WIDTH(), gui.SCREEN_PIXEL_HEIGHT())
+    (agents, array_agents) = ([], [])
+    for _ in range(n):
+        xy = Pixel_xy((rng.uniform(0, width - 1), rng.uniform(0, height - 1)))
+        heading = int(rng.integers(360))
+        for (cls, group) in [(Agent, agents), (ArrayAgent, array_agents)]:
+            agent = cls(center_pixel=xy)
+            agent.set_heading(heading)
+            group.append(agent)
+    return (agents, array_agents)
+
+
+def assert_same_state(agents, array_agents):
+    for (agent, array_agent) in zip(agents, array_agents):
+        assert np.allclose(array_agent.center_pixel, agent.center_pixel)
+        assert array_agent.heading == agent.heading
+        assert np.allclose(array_agent.velocity, agent.velocity)
+        assert array_agent.moves == agent.moves
+        assert array_agent.current_patch() is agent.current_patch()
+        assert array_agent in agent.current_patch().agents
+
+
+@pytest.mark.parametrize('bounce', [True, False])
+def test_forward_matches_agent_forward(bounce):
+    PyLogo_headless(bounce=bounce, max_ticks=0)
+    (agents, array_agents) = agent_pairs(200)
+    speeds = [0.5, 7, 13]
+    for step in range(40):
+        speed = speeds[step % len(speeds)]
+        for agent in agents:
+            agent.forward(speed)
+        World.agent_set.forward(speed)
+        assert_same_state(agents, array_agents)
+
+
+def test_velocity_round_trips_and_velocity_dxdy_matches_the_agents():
+    PyLogo_headless(max_ticks=0)
+    (agents, array_agents) = agent_pairs(20)
+    for (i, (agent, array_agent)) in enumerate(zip(agents, array_agents)):
+        velocity = Velocity((0.3 + i/7, -1.7 + i/5))
+        agent.set_velocity(velocity)
+        array_agent.set_velocity(velocity)
+        assert array_agent.velocity == velocity
+        # As for an Agent, turning doesn't change the velocity.
+        agent.turn_right(3*i)
+        array_agent.turn_right(3*i)
+    assert_same_state(agents, array_agents)
+
+    (dx, dy) = World.agent_set.velocity_dxdy()
+    assert np.array_equal(dx, [agent.velocity.dx for agent in agents])
+    assert np.array_equal(dy, [agent.velocity.dy for agent in agents])
+
+    for agent in agents:
+        agent.move_by_velocity()
+    World.agent_set.move_by_velocity()
+    assert_same_state(agents, array_agents)
+
+
+def test_move_by_velocity_wraps_like_pixel_wrap():
+    PyLogo_headless(bounce=False, max_ticks=0)
+    (width, height) = (gui.SCREEN_PIXEL_WIDTH(), gui.SCREEN_PIXEL_HEIGHT())
+    corner = ArrayAgent(center_pixel=Pixel_xy((width - 3, 2)))
+    corner.set_velocity(Velocity((5, -4)))
+    World.agent_set.move_by_velocity()
+    expected = Pixel_xy((width + 2, -2)).wrap()
+    assert np.allclose(corner.center_pixel, expected)
+    (row, col) = expected.pixel_to_row_col()
+    assert corner in World.patches_array[row, col].agents
+    assert sum(corner in patch.agents for patch in World.patches) == 1
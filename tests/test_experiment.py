@@ -0,0 +1,50 @@
+from core.experiment import run_experiment
+from core.graph_framework import GRAPH_TYPE, Graph_Node, LINK_PROB, NBR_NODES, RANDOM, SMALL_WORLD, \
+    graph_left_upper, graph_right_upper
+from core.world_patch_block import World
+from models.graph_algorithms import Graph_Algorithms_World
+from models.segregation import Segregation_Patch, Segregation_World, gui_left_upper as segregation_left_upper, \
+    nbr_unhappy
+
+
+def node_positions(world):
+    return tuple(node.center_pixel for node in sorted(World.agents, key=lambda node: node.id))
+
+
+def link_ends(world):
+    return sorted(tuple(sorted((lnk.agent_1.id, lnk.agent_2.id))) for lnk in World.links)
+
+
+def clustering(world):
+    return world.clustering_coefficient()
+
+
+def graph_experiment():
+    return run_experiment(Graph_Algorithms_World, {GRAPH_TYPE: [RANDOM, SMALL_WORLD], NBR_NODES: 30, LINK_PROB: 20},
+                          reporters={'positions': node_positions, 'links': link_ends, 'clustering': clustering},
+                          replicates=2, gui_left_upper=graph_left_upper, gui_right_upper=graph_right_upper,
+                          agent_class=Graph_Node, max_ticks=20, processes=3, base_seed=7)
+
+
+def test_run_experiment_twice_returns_the_same_rows():
+    first = graph_experiment()
+    second = graph_experiment()
+    assert [row['run'] for row in first] == [0, 1, 2, 3]
+    assert first == second
+    # The replicates differ from each other.
+    assert first[0]['links'] != first[1]['links']
+
+
+def segregation_experiment():
+    return run_experiment(Segregation_World, {'density': 80, '% similar wanted': [40, 70]},
+                          reporters={'unhappy': nbr_unhappy, 'colors': patch_colors}, replicates=2,
+                          gui_left_upper=segregation_left_upper, patch_class=Segregation_Patch,
+                          board_rows_cols=(21, 21), max_ticks=10, processes=2, base_seed=3)
+
+
+def patch_colors(world):
+    return [tuple(patch.color) for patch in World.patches]
+
+
+def test_segregation_experiment_is_repeatable():
+    assert segregation_experiment() == segregation_experiment()
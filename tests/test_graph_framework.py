@@ -0,0 +1,40 @@
+import numpy as np
+
+from core.agent import PyLogo_headless
+from core.graph_framework import Graph_Node, Graph_World, graph_left_upper, graph_right_upper
+from core.link import Link
+from core.pairs import Pixel_xy, heading_to_unit_dxdy
+from core.world_patch_block import World
+
+
+def graph_world(bounce):
+    """ A Graph_World with its initial graph deleted. """
+    world = PyLogo_headless(Graph_World, graph_left_upper, gui_right_upper=graph_right_upper,
+                            agent_class=Graph_Node, bounce=bounce, max_ticks=0)
+    for node in list(World.agents):
+        node.delete()
+    return world
+
+
+def test_force_directed_step_with_wrap_matches_adjust_distances():
+    world = graph_world(bounce=False)
+    # The nodes are close enough together that none of the distances between them go around the edges,
+    # but the far walls are more than half the screen away.
+    rng = np.random.default_rng(11)
+    nodes = [Graph_Node(center_pixel=Pixel_xy(tuple(xy))) for xy in rng.uniform(20, 150, (12, 2))]
+    for (i, j) in [(0, 1), (1, 2), (2, 3), (3, 0), (4, 5), (6, 7), (7, 8), (8, 4), (9, 10)]:
+        Link(nodes[i], nodes[j])
+
+    unit = Graph_World.screen_distance_unit()
+    # The per-node computation, with every node's force computed before any of them moves.
+    forces = {node: node.compute_velocity(unit, world.velocity_adjustment) for node in nodes}
+    expected = {}
+    for node in nodes:
+        heading = int(round(node.center_pixel.heading_toward(node.center_pixel + forces[node])))
+        expected[node] = (heading, (node.center_pixel + heading_to_unit_dxdy(heading)).wrap())
+
+    world.force_directed_step(unit)
+    for node in nodes:
+        (heading, center_pixel) = expected[node]
+        assert node.heading == heading
+        assert np.allclose(node.center_pixel, center_pixel)
@@ -0,0 +1,29 @@
+import os
+
+from core.agent import PyLogo_headless
+
+
+def test_game_of_life_headless():
+    from models.game_of_life import Life_Patch, Life_World, gol_left_upper
+
+    world = PyLogo_headless(Life_World, gol_left_upper, patch_class=Life_Patch, max_ticks=5)
+    assert world.ticks == 5
+
+
+def test_ga_tsp_headless():
+    from models.ga_and_aco_examples.ga_tsp import TSP_Agent, TSP_World, tsp_gui_left_upper, tsp_right_upper
+
+    world = PyLogo_headless(TSP_World, tsp_gui_left_upper, gui_right_upper=tsp_right_upper, agent_class=TSP_Agent,
+                            bounce=(True, False), parameters={'Animate construction': False}, max_ticks=5)
+    assert world.ticks == 5
+    assert world.best_ind is not None
+
+
+def test_headless_restores_sdl_videodriver(monkeypatch):
+    monkeypatch.delenv('SDL_VIDEODRIVER', raising=False)
+    PyLogo_headless(max_ticks=1)
+    assert 'SDL_VIDEODRIVER' not in os.environ
+
+    monkeypatch.setenv('SDL_VIDEODRIVER', 'dummy')
+    PyLogo_headless(max_ticks=1)
+    assert os.environ['SDL_VIDEODRIVER'] == 'dummy'
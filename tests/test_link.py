@@ -0,0 +1,87 @@
+import pytest
+
+import core.gui as gui
+from core.agent import Agent, PyLogo_headless
+from core.link import Link, delete_links, is_reachable_via, link_exists, minimum_spanning_tree
+from core.pairs import Pixel_xy, Topology
+from core.sim_engine import SimEngine
+from core.world_patch_block import World
+
+
+@pytest.fixture
+def world():
+    return PyLogo_headless(bounce=True, max_ticks=0)
+
+
+def test_link_length_follows_the_topology(world):
+    width = gui.SCREEN_PIXEL_WIDTH()
+    (agent_1, agent_2) = (Agent(), Agent())
+    agent_1.move_to_xy(Pixel_xy((5, 100)))
+    agent_2.move_to_xy(Pixel_xy((width - 6, 100)))
+    lnk = Link(agent_1, agent_2)
+    assert lnk.length == width - 11
+
+    # Turn Bounce? off without moving either agent. The link is now shorter the way around the edge.
+    SimEngine.values['Bounce?'] = False
+    Topology.refresh()
+    assert lnk.length == 10
+
+
+def agents_at(xys):
+    agents = [Agent() for _ in xys]
+    for (agent, xy) in zip(agents, xys):
+        agent.move_to_xy(Pixel_xy(xy))
+    return agents
+
+
+def ends(links):
+    return {frozenset((lnk.agent_1, lnk.agent_2)) for lnk in links}
+
+
+def test_is_reachable_via(world):
+    (a, b, c, d) = agents_at([(100, 100), (130, 100), (130, 140), (300, 300)])
+    triangle = [Link(a, b), Link(b, c), Link(c, a)]
+    assert is_reachable_via(a, triangle, c)
+    assert not is_reachable_via(a, triangle, d)
+    # As before, an agent is not reachable from itself, even around a cycle.
+    assert not is_reachable_via(a, triangle, a)
+
+
+def test_minimum_spanning_tree(world):
+    (a, b, c, d, e) = agents_at([(100, 100), (130, 100), (130, 140), (200, 100), (200, 160)])
+    # The pairs by length: a-b 30, b-c 40, a-c 50, d-e 60, b-d 70, c-e 72.8, ...
+    assert ends(minimum_spanning_tree([a, b, c, d, e])) == ends([Link(a, b), Link(b, c), Link(d, e), Link(b, d)])
+
+
+def previous_minimum_spanning_tree(agent_list):
+    """ The implementation minimum_spanning_tree replaced: try every pair in order of length. """
+    all_links = [Link(agent_list[i], agent_list[j], add_to_world_links=False)
+                 for i in range(len(agent_list) - 1) for j in range(i + 1, len(agent_list))]
+    link_list = []
+    for lnk in sorted(all_links, key=lambda lnk: lnk.length):
+        if not is_reachable_via(lnk.agent_1, link_list, lnk.agent_2):
+            link_list.append(lnk)
+    return link_list
+
+
+def test_minimum_spanning_tree_matches_the_previous_implementation(world):
+    # A lattice, so that many pairs are the same length, plus a few points off it.
+    xys = [(50 + 40*i, 60 + 40*j) for i in range(5) for j in range(4)] + [(75, 95), (233, 171), (301, 52)]
+    agents = agents_at(xys)
+    assert ends(minimum_spanning_tree(agents)) == ends(previous_minimum_spanning_tree(agents))
+
+
+def test_delete_links(world):
+    (a, b, c, d) = agents_at([(100, 100), (130, 100), (130, 140), (300, 300)])
+    (a_b, b_c, c_a, c_d) = (Link(a, b), Link(b, c), Link(c, a), Link(c, d, directed=True))
+    # c_b is equal to b_c but isn't the Link in World.links. a_d isn't in World.links at all.
+    (c_b, a_d) = (Link(c, b, add_to_world_links=False), Link(a, d, add_to_world_links=False))
+    delete_links([a_b, c_d, c_b, a_d])
+
+    assert World.links == {c_a}
+    assert World.link_set().agent_links == {a: {c_a}, c: {c_a}}
+    assert link_exists(a, c) is c_a
+    assert link_exists(a, b) is None
+    assert link_exists(b, c) is None
+    assert link_exists(c, d, directed=True) is None
+    assert b_c not in World.links
@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+
+from core.pairs import Pixel_xy, REP_COEFF, REP_EXPONENT, Topology, force_as_dxdy, repulsive_forces
+from core.sim_engine import SimEngine
+
+
+@pytest.fixture
+def no_wrap():
+    (values, wrap) = (SimEngine.values, Topology.wrap)
+    SimEngine.values = {REP_COEFF: 1.5, REP_EXPONENT: 2, 'Bounce?': True}
+    Topology.wrap = False
+    yield SimEngine.values
+    (SimEngine.values, Topology.wrap) = (values, wrap)
+
+
+def pairwise_forces(xys, screen_distance_unit, radius):
+    """ The sum over the other pixels (closer than radius, if given) of force_as_dxdy, one pair at a time. """
+    pixels = [Pixel_xy(tuple(xy)) for xy in xys]
+    forces = np.zeros((len(pixels), 2))
+    for (i, pixel_a) in enumerate(pixels):
+        for pixel_b in pixels:
+            if pixel_b is not pixel_a and (radius is None or pixel_a.distance_to(pixel_b) < radius):
+                forces[i] += force_as_dxdy(pixel_a, pixel_b, screen_distance_unit)
+    return forces
+
+
+@pytest.mark.parametrize('rep_exponent', [2, -2])
+@pytest.mark.parametrize('radius', [None, 60])
+def test_repulsive_forces_match_force_as_dxdy(no_wrap, rep_exponent, radius):
+    no_wrap[REP_EXPONENT] = rep_exponent
+    xys = np.random.default_rng(17).uniform(0, 400, (400, 2))
+    expected = pairwise_forces(xys, 8, radius)
+
+    exact = repulsive_forces(xys, 8, radius=radius, exact_below=len(xys) + 1)
+    assert np.allclose(exact, expected)
+
+    barnes_hut = repulsive_forces(xys, 8, radius=radius, exact_below=0)
+    errors = np.hypot(*(barnes_hut - expected).T)
+    magnitudes = np.hypot(*expected.T)
+    assert np.median(errors) < 0.03 * np.median(magnitudes)
+    assert np.percentile(errors / magnitudes, 95) < 0.15
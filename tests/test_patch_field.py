@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+from core.agent import PyLogo_headless
+from core.world_patch_block import World
+
+
+def test_patch_field_diffuse_and_neighbor_sum():
+    world = PyLogo_headless(board_rows_cols=(5, 5), max_ticks=0)
+    chemical = world.patch_field('chemical')
+
+    chemical[2, 2] = 8
+    chemical.diffuse(0.5)
+    # The center keeps half and gives 0.5 to each of its 8 neighbors.
+    expected = np.zeros((5, 5))
+    expected[1:4, 1:4] = 0.5
+    expected[2, 2] = 4
+    assert np.allclose(chemical.values, expected)
+
+    chemical.reset()
+    chemical[0, 0] = 8
+    chemical.diffuse(0.5, wrap=False)
+    # Without wrap, the shares for the 5 neighbors off the grid stay home.
+    expected = np.zeros((5, 5))
+    expected[0, 1] = expected[1, 0] = expected[1, 1] = 0.5
+    expected[0, 0] = 6.5
+    assert np.allclose(chemical.values, expected)
+    assert chemical.values.sum() == 8
+    assert chemical.count() == 4
+    assert chemical.count(0.5) == 3
+
+    chemical.reset()
+    chemical[0, 0] = 1
+    wrapped = chemical.neighbor_sum()
+    assert wrapped.sum() == 8
+    assert all(wrapped[r, c] == 1 for (r, c) in [(4, 4), (4, 0), (4, 1), (0, 4), (0, 1), (1, 4), (1, 0), (1, 1)])
+    assert wrapped[0, 0] == 0
+    assert chemical.neighbor_sum(nbr_count=4, wrap=False).sum() == 2
+
+
+def test_patch_field_property():
+    world = PyLogo_headless(board_rows_cols=(5, 5), max_ticks=0)
+    chemical = world.patch_field('chemical')
+    patch = World.patches_array[1, 3]
+    patch.chemical = 2.5
+    assert chemical[1, 3] == 2.5
+    chemical[1, 3] = 7
+    assert patch.chemical == 7
+
+
+def test_patch_field_in_a_second_world_of_another_size():
+    first = PyLogo_headless(board_rows_cols=(5, 5), max_ticks=0)
+    first_chemical = first.patch_field('chemical')
+    first_chemical[4, 4] = 1
+
+    second = PyLogo_headless(board_rows_cols=(7, 9), max_ticks=0)
+    corner = World.patches_array[6, 8]
+    # The second World hasn't declared chemical, so its patches don't have it.
+    with pytest.raises(AttributeError):
+        _ = corner.chemical
+    assert not hasattr(World.patches_array[4, 4], 'chemical')
+
+    second_chemical = second.patch_field('chemical')
+    assert second_chemical.values.shape == (7, 9)
+    assert World.patches_array[4, 4].chemical == 0
+    corner.chemical = 3
+    assert corner.chemical == 3
+    assert second_chemical[6, 8] == 3
+    assert first_chemical.values.sum() == 1
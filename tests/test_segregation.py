@@ -0,0 +1,23 @@
+from core.agent import PyLogo_headless
+from core.world_patch_block import World
+from models.segregation import Segregation_Agent, Segregation_Patch, Segregation_World, gui_left_upper
+
+
+def test_only_the_patches_agents_move_from_and_to_are_redrawn(monkeypatch):
+    world = PyLogo_headless(Segregation_World, gui_left_upper, patch_class=Segregation_Patch,
+                            parameters={'% similar wanted': 70}, board_rows_cols=(21, 21), max_ticks=0)
+    moves = set()
+    find_new_spot = Segregation_Agent.find_new_spot
+
+    def recording_find_new_spot(agent, empty_patches):
+        moves.add(agent.current_patch())
+        find_new_spot(agent, empty_patches)
+        moves.add(agent.current_patch())
+
+    monkeypatch.setattr(Segregation_Agent, 'find_new_spot', recording_find_new_spot)
+    world.draw_changes_only = True
+    world.reset_changes()
+    world.step()
+    assert moves
+    # Not the patches an agent merely considered moving to.
+    assert World.dirty_patches == moves